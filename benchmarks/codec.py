@@ -0,0 +1,82 @@
+"""
+Bytes per cache entry and time to serve a cache hit from it (decode, plus
+reading the first page of a playlist), legacy JSON vs bot.util.codec.
+
+    python -m benchmarks.codec
+"""
+import timeit
+
+from bot.util.audio.schema import AudioRequestData, AudioTrackData
+from bot.util.codec import decode, encode
+from bot.util.social.schema import SocialVideoData
+from bot.util.youtube.enum import SourceLang, TargetLang
+from bot.util.youtube.schema import YouTubeVideoData
+
+# real file_ids are ~70-90 chars of base64
+_FILE_ID = "BAACAgIAAxkDAAIBZ2YxQ3p5Vb6cN0s8wz4-HbT3xk7pAAJ5SwACq4CQSdo1XbB5z8DiNAQ"
+
+
+def _entries() -> dict[str, object]:
+    youtube = YouTubeVideoData(
+        link="https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+        target_lang=TargetLang.RU,
+        file_ids=[_FILE_ID] * 3,
+        width=854,
+        height=480,
+        source_lang=SourceLang.EN,
+        translated_lang=TargetLang.RU,
+        title="Rick Astley - Never Gonna Give You Up (Official Music Video)",
+        author="Rick Astley",
+        length=213,
+    )
+    social = SocialVideoData(
+        link="https://www.instagram.com/reel/C1a2b3c4d5e/",
+        origin="instagram",
+        file_ids=[_FILE_ID],
+        video_id="C1a2b3c4d5e",
+        width=720,
+        height=1280,
+        title="Video by someone",
+    )
+    playlist = AudioRequestData(
+        link="https://soundcloud.com/someone/sets/a-long-set",
+        tracks=[
+            AudioTrackData(
+                extractor="soundcloud",
+                id=str(1_000_000 + i),
+                webpage_url=f"https://soundcloud.com/someone/track-number-{i}",
+                title=f"Track number {i}",
+                uploader="someone",
+                duration=180 + i,
+                file_id=_FILE_ID if i < 10 else None,  # only the first page delivered so far
+            )
+            for i in range(200)
+        ],
+    )
+    return {"youtube": youtube, "social": social, "playlist (200 tracks)": playlist}
+
+
+def _hit(model_cls: type, raw: str) -> None:
+    entry = decode(model_cls, raw)
+    if isinstance(entry, AudioRequestData):
+        entry.page(1)
+
+
+def main() -> None:
+    print(f"{'entry':<24}{'json B':>9}{'codec B':>9}{'json µs':>10}{'codec µs':>10}")
+    for name, entry in _entries().items():
+        model_cls = type(entry)
+        legacy = entry.model_dump_json()
+        compact = encode(entry)
+        assert decode(model_cls, legacy) == entry
+        assert encode(decode(model_cls, compact)) == compact
+
+        runs = 2000
+        json_us = timeit.timeit(lambda m=model_cls, r=legacy: _hit(m, r), number=runs) / runs * 1e6
+        codec_us = timeit.timeit(lambda m=model_cls, r=compact: _hit(m, r), number=runs) / runs * 1e6
+        compact_bytes = len(compact.encode("utf-8", "surrogateescape"))
+        print(f"{name:<24}{len(legacy):>9}{compact_bytes:>9}{json_us:>10.1f}{codec_us:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
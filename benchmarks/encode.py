@@ -0,0 +1,69 @@
+"""
+Wall-clock time to downscale a long 720p video-only stream to 480p: one
+libx264 process over the whole file (the regular merge) vs
+bot.util.youtube.video.encode_chunked over the worker's CPU slots.
+
+    python -m benchmarks.encode [duration_seconds]
+
+Needs ffmpeg on PATH; the source is synthesized with lavfi, so no network.
+"""
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bot.config import settings
+from bot.util.youtube.video import encode_chunked
+
+_HEIGHT = 480
+
+
+def _source(output_dir: Path, duration: int) -> Path:
+    path = output_dir / "source.mp4"
+    subprocess.run(
+        [
+            "ffmpeg", "-y", "-f", "lavfi", "-i", f"testsrc2=size=1280x720:rate=30:duration={duration}",
+            "-c:v", "libx264", "-preset", "ultrafast", "-g", "60", str(path),
+        ],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    return path
+
+
+def _single(source: Path, output_dir: Path) -> Path:
+    output = output_dir / "single.mp4"
+    subprocess.run(
+        ["ffmpeg", "-y", "-i", str(source), "-vf", f"scale=-2:{_HEIGHT}", "-c:v", "libx264", str(output)],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    return output
+
+
+def _duration(path: Path) -> float:
+    out = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", str(path)],
+        check=True, capture_output=True, text=True,
+    )
+    return float(out.stdout)
+
+
+def main() -> None:
+    duration = int(sys.argv[1]) if len(sys.argv) > 1 else 600
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_path = Path(tmp)
+        source = _source(tmp_path, duration)
+        print(f"{duration}s 720p source, {settings.worker_cpu_slots} CPU slots")
+
+        for name, run in (
+            ("single process", lambda: _single(source, tmp_path)),
+            ("chunked", lambda: encode_chunked(source, tmp_path, _HEIGHT, duration)),
+        ):
+            started = time.perf_counter()
+            output = run()
+            elapsed = time.perf_counter() - started
+            print(f"{name:<16}{elapsed:>8.1f}s  output {_duration(output):.1f}s, {output.stat().st_size // 1024}KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Import time and peak RSS of the two processes' entry points, each measured in
+a fresh interpreter: bot.handlers (what main.py loads) and bot.worker.actors
+(what the dramatiq CLI loads). Also lists which of the heavy third-party
+modules each one ends up importing.
+
+    python -m benchmarks.startup [runs]
+
+Needs the usual environment (BOT_TOKEN, REDIS_URL...); nothing connects anywhere.
+"""
+import json
+import statistics
+import subprocess
+import sys
+
+_TARGETS = (("bot", "bot.handlers"), ("worker", "bot.worker.actors"))
+_HEAVY = ("faster_whisper", "ctranslate2", "pydub", "yt_dlp", "pytubefix", "numpy", "av")
+
+_PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{
+    "seconds": elapsed,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+
+def _probe(module: str) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", _PROBE.format(module=module, heavy=_HEAVY)],
+        check=True, capture_output=True, text=True,
+    )
+    return json.loads(out.stdout.splitlines()[-1])
+
+
+def main() -> None:
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"median of {runs} fresh interpreters")
+    for name, module in _TARGETS:
+        results = [_probe(module) for _ in range(runs)]
+        seconds = statistics.median(r["seconds"] for r in results)
+        rss_mb = statistics.median(r["rss_mb"] for r in results)
+        heavy = ", ".join(results[0]["heavy"]) or "-"
+        print(f"{name:<8}{module:<20}{seconds:>7.2f}s {rss_mb:>7.0f}MB  heavy: {heavy}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import os
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
@@ -17,11 +18,82 @@ class Settings(BaseSettings):
     loglevel: str = "INFO"
 
     dump_chat_id: int  # where parts of YouTube videos will be posted to be sent as a media group later
+    # optional extra dump chats and upload-only bot tokens to spread uploads over (see bot.worker.dump);
+    # every token must be able to post in every dump chat, and bot_token must be able to read them all
+    dump_chat_ids: list[int] = Field(default_factory=list)
+    uploader_bot_tokens: list[str] = Field(default_factory=list)
     admin_chat_id: int | None = None
 
     enable_audio_translation: bool = False
     max_video_resolution: int = 480
     max_playlist_tracks: int = 200
+    # YouTube videos longer than this go to the youtube_long queue (see bot.worker.queues)
+    youtube_long_video_seconds: int = 20 * 60
+    # upload the audio track next to the video, so "🎵 Get audio" never needs a job
+    youtube_upload_audio: bool = True
+    # videos up to this long (Shorts...) are taken as one progressive mp4 when one fits, skipping the merge
+    youtube_progressive_max_seconds: int = 3 * 60
+    # how long a fetched innertube player response (metadata + stream manifest) is
+    # shared between the processes working on the same video; stream URLs live ~6h
+    youtube_info_ttl: int = 10 * 60  # seconds
+
+    # run actors as coroutines on one shared event loop (dramatiq's AsyncIO
+    # middleware) instead of one private loop per worker thread -- pair with a
+    # much higher `--threads`, since threads only park on their job's future
+    worker_asyncio: bool = False
+    # blocking-call pool (yt-dlp, pytubefix, ffprobe) shared by all jobs in a worker process
+    worker_io_threads: int = 16
+    # how many CPU-heavy stages (ffmpeg encodes/splits, whisper) may run at once per process
+    worker_cpu_slots: int = os.cpu_count() or 2
+    # language detection for translations: one Whisper model per worker process,
+    # loaded at boot and dropped after sitting idle (see bot.util.youtube.whisper)
+    whisper_model: str = "tiny"
+    whisper_cpu_threads: int = 2  # per detection
+    whisper_num_workers: int = 1  # detections running at once
+    whisper_queue_size: int = 8  # detections running or waiting; past this, videos go out untranslated
+    whisper_idle_unload: int = 15 * 60  # seconds; 0 keeps the model loaded
+    # downscales of videos at least this long are encoded in chunks, in parallel over the free CPU slots
+    encode_chunked_min_seconds: int = 10 * 60
+
+    # Self-hosted telegram-bot-api server (https://github.com/tdlib/telegram-bot-api),
+    # e.g. http://telegram-bot-api:8081. With telegram_api_local (the server runs
+    # with --local) the upload cap goes from 50MB to 2000MB and files are sent as
+    # file:// paths the server reads itself, so worker temp dirs must be mounted at
+    # the same path in both containers. Without it, the cloud's 50MB cap still applies.
+    telegram_api_url: str | None = None
+    telegram_api_local: bool = False
+
+    # Bot API request budget, shared through Redis by the bot and all workers
+    # (see bot.util.rate_limit); rates are per second, bursts in requests
+    telegram_global_rate: float = 25
+    telegram_global_burst: float = 30
+    telegram_private_rate: float = 1
+    telegram_private_burst: float = 3
+    telegram_group_rate: float = 20 / 60
+    telegram_group_burst: float = 5
+
+    # Cache entry lifetimes, refreshed on every hit (see bot.util.cache). With
+    # cache_max_memory_mb set, each sweep deletes the least recently used entries
+    # past that budget -- cache entries only, never job locks, waiters, checkpoints
+    # or the queues. Redis itself should run with maxmemory-policy noeviction.
+    cache_youtube_ttl_days: int = 30
+    cache_social_ttl_days: int = 14
+    cache_audio_ttl_days: int = 30
+    cache_pager_ttl_days: int = 7  # audio pager message ids, only needed to clean up old pages
+    cache_max_memory_mb: int | None = None
+    cache_sweep_interval: int = 60 * 60  # seconds
+    # in-memory cache of decoded entries in the bot process, in front of Redis
+    cache_local_size: int = 1024  # entries
+    cache_local_ttl: int = 5 * 60  # seconds
+    # how long a link that failed for good (private, removed, ...) is answered from memory
+    cache_negative_ttl: int = 30 * 60  # seconds
+
+    # /stats counters are buffered per process and written in one pipeline
+    # every stats_flush_interval or stats_flush_events events, whichever comes first
+    stats_flush_interval: float = 1  # seconds
+    stats_flush_events: int = 100
+    # how often finished days are folded into the weekly/monthly rollups and time series
+    stats_rollup_interval: int = 60 * 60  # seconds
 
     # populated on setup
     bot_username: str | None = None
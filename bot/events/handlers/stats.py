@@ -1,88 +1,237 @@
-import redis.asyncio as redis
+import asyncio
+import logging
+import threading
+import weakref
+from collections import Counter, defaultdict
+from datetime import date, datetime, time
+
 from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+from redis.exceptions import RedisError, ResponseError, WatchError
 
 from bot.config import settings
 from bot.events.signals import (
+    flush_handler,
     on_link_received,
     on_social_video_fail,
     on_social_video_sent,
     on_yt_video_fail,
     on_yt_video_sent,
     signal_handler,
+    spawn,
 )
-from bot.util.redis import redis_client
+from bot.util.redis import current_redis_client
 
-_TTL = 90 * 24 * 3600  # 90 days
+log = logging.getLogger(__name__)
 
+# Per day: one hash of counters (requests, chat:<type>, lang:<code>,
+# success:<platform>, fail:<kind>) and a HyperLogLog of user ids, so /stats
+# reads a fixed number of keys however many users or platforms there are.
+STATS_TTL = 90 * 24 * 3600  # 90 days
 
-def _today() -> str:
-    return settings.now().strftime("%Y-%m-%d")
+# Finished days are folded into per-week and per-month hashes and
+# HyperLogLogs, and into a RedisTimeSeries series per counter, by
+# bot.util.stats.rollup_stats. ROLLUP_MARK_KEY names the last day folded.
+ROLLUP_MARK_KEY = "stats:rollup:last"
+
+
+def stats_key(day: str) -> str:
+    return f"stats:{day}"
+
+
+def users_key(day: str) -> str:
+    return f"stats:{day}:uniq"
+
+
+def week_key(d: date) -> str:
+    year, week, _ = d.isocalendar()
+    return f"stats:week:{year}-W{week:02d}"
+
+
+def month_key(d: date) -> str:
+    return f"stats:month:{d:%Y-%m}"
 
 
-async def _incr(client: Redis, key: str) -> None:
-    await client.incr(key)
-    await client.expire(key, _TTL)
+def series_key(field: str) -> str:
+    return f"stats:ts:{field}"
+
+
+def day_ms(d: date) -> int:
+    return int(datetime.combine(d, time(), settings.timezone).timestamp() * 1000)
+
+
+_timeseries: bool | None = None
+
+
+async def has_timeseries(client: Redis) -> bool:
+    """Whether the server has the RedisTimeSeries module (redis-stack); asked once per process."""
+    global _timeseries
+    if _timeseries is None:
+        try:
+            modules = await client.module_list()
+        except ResponseError as e:
+            # MODULE is often disabled on hosted Redis
+            log.warning("could not list redis modules: %r", e)
+            modules = []
+        _timeseries = any(m.get("name") == "timeseries" for m in modules)
+        if not _timeseries:
+            log.warning("redis has no RedisTimeSeries module, stats rollups go without time series")
+    return _timeseries
+
+
+def _today() -> str:
+    return settings.now().strftime("%Y-%m-%d")
 
 
-async def _sadd(client: Redis, key: str, value: str) -> None:
-    await client.sadd(key, value)
-    await client.expire(key, _TTL)
+class _StatsBuffer:
+    """
+    Counters and user ids gathered on one event loop, written to Redis in a
+    single pipeline every settings.stats_flush_interval seconds or
+    settings.stats_flush_events events, whichever comes first -- instead of a
+    pipeline round-trip per event.
+    """
+
+    def __init__(self) -> None:
+        self.counts: Counter[tuple[str, str]] = Counter()  # (day, field) -> increment
+        self.users: defaultdict[str, set[str]] = defaultdict(set)  # day -> user ids
+        self.events = 0
+        self._timer: asyncio.TimerHandle | None = None
+        self._flush_spawned = False  # until that flush takes the batch, later adds needn't spawn another
+
+    def add(self, *fields: str, user_id: int | None = None) -> None:
+        day = _today()
+        for field in fields:
+            self.counts[day, field] += 1
+        if user_id is not None:
+            self.users[day].add(str(user_id))
+        self.events += 1
+        if self.events >= settings.stats_flush_events:
+            if not self._flush_spawned:
+                self._flush_spawned = True
+                spawn(self.flush())
+        elif self._timer is None:
+            # the timer callback runs in the current context, so the flush
+            # gets this loop's current_redis_client()
+            self._timer = asyncio.get_running_loop().call_later(
+                settings.stats_flush_interval, lambda: spawn(self.flush()),
+            )
+
+    async def flush(self) -> None:
+        self._flush_spawned = False
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self.events:
+            return
+        counts, users = self.counts, self.users
+        self.counts, self.users, self.events = Counter(), defaultdict(set), 0
+
+        client = current_redis_client()
+        try:
+            today = _today()
+            if any(day < today for day, _ in counts) or any(day < today for day in users):
+                # held over midnight: the rollup may have folded the day already
+                await _write_late(client, counts, users)
+            else:
+                async with client.pipeline(transaction=False) as pipe:
+                    _write(pipe, counts, users)
+                    await pipe.execute()
+        except RedisError as e:
+            # analytics: losing a second's worth of counters beats piling them up
+            log.warning("failed to flush %d stats counters: %r", sum(counts.values()), e)
+
+
+def _write(pipe: Pipeline, counts: Counter[tuple[str, str]], users: dict[str, set[str]]) -> None:
+    for (day, field), n in counts.items():
+        pipe.hincrby(stats_key(day), field, n)
+    for day, ids in users.items():
+        pipe.pfadd(users_key(day), *ids)
+        pipe.expire(users_key(day), STATS_TTL)
+    for day in {day for day, _ in counts} | users.keys():
+        pipe.expire(stats_key(day), STATS_TTL)
+
+
+async def _write_late(client: Redis, counts: Counter[tuple[str, str]], users: dict[str, set[str]]) -> None:
+    """
+    Like _write, plus -- for days the rollup has folded already -- the same
+    increments to their week and month and time series. Watches the mark, so
+    a day folded in the meantime is never left out, nor counted twice.
+    """
+    timeseries = await has_timeseries(client)
+    async with client.pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                await pipe.watch(ROLLUP_MARK_KEY)
+                mark = await pipe.get(ROLLUP_MARK_KEY) or ""
+                pipe.multi()
+                _write(pipe, counts, users)
+                for (day, field), n in counts.items():
+                    if day > mark:
+                        continue
+                    d = date.fromisoformat(day)
+                    for bucket in (week_key(d), month_key(d)):
+                        pipe.hincrby(bucket, field, n)
+                    if timeseries:
+                        pipe.ts().add(
+                            series_key(field), day_ms(d), n, labels={"stats": "counter"}, on_duplicate="sum",
+                        )
+                for day, ids in users.items():
+                    if day <= mark:
+                        d = date.fromisoformat(day)
+                        for bucket in (week_key(d), month_key(d)):
+                            pipe.pfadd(f"{bucket}:uniq", *ids)
+                await pipe.execute()
+                return
+            except WatchError:
+                continue
+
+
+# one buffer per event loop: a worker runs one loop per thread, each with its own Redis client
+_buffers: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _StatsBuffer] = weakref.WeakKeyDictionary()
+_buffers_lock = threading.Lock()
+
+
+def _buffer() -> _StatsBuffer:
+    loop = asyncio.get_running_loop()
+    with _buffers_lock:
+        return _buffers.setdefault(loop, _StatsBuffer())
+
+
+@flush_handler
+async def flush_stats() -> None:
+    await _buffer().flush()
 
 
 @signal_handler(on_link_received)
 async def stats_link_received(message, origin):
-    # Only ever fired from the aiogram process's own persistent event loop,
-    # so the shared singleton is safe here (unlike the four handlers below).
     if not message.from_user:
         return
-    d = _today()
     lang = (message.from_user.language_code or "unknown").lower()
-    await _incr(redis_client, f"stats:{d}:requests")
-    await _sadd(redis_client, f"stats:{d}:users", str(message.from_user.id))
-    await _incr(redis_client, f"stats:{d}:chat:{message.chat.type}")
-    await _incr(redis_client, f"stats:{d}:lang:{lang}")
+    _buffer().add("requests", f"chat:{message.chat.type}", f"lang:{lang}", user_id=message.from_user.id)
 
 
 # The four handlers below receive signals that are also fired from Dramatiq
-# actors (bot/worker/actors.py), where each job runs under its own
-# short-lived asyncio.run() event loop. Reusing the shared redis_client
-# singleton there breaks on a worker's second job (see the Global
-# Constraints amendment in the dramatiq-task-queue plan) — each handler
-# opens and closes its own connection instead.
+# actors (bot/worker/actors.py). The flush's current_redis_client() resolves to
+# the worker thread's pooled client there (bot.worker.runtime), and to the
+# shared singleton in the aiogram process -- never a client from another event loop.
 
 
 @signal_handler(on_yt_video_sent)
 async def stats_yt_sent(link, chat_id, chat_type, bot, video, fresh):
-    client = redis.from_url(str(settings.redis_dsn), decode_responses=True)
-    try:
-        await _incr(client, f"stats:{_today()}:success:youtube")
-    finally:
-        await client.aclose()
+    _buffer().add("success:youtube")
 
 
 @signal_handler(on_social_video_sent)
 async def stats_social_sent(link, chat_id, chat_type, bot, video, fresh):
-    client = redis.from_url(str(settings.redis_dsn), decode_responses=True)
-    try:
-        platform = (video.origin or "social").lower()
-        await _incr(client, f"stats:{_today()}:success:{platform}")
-    finally:
-        await client.aclose()
+    platform = (video.origin or "social").lower()
+    _buffer().add(f"success:{platform}")
 
 
 @signal_handler(on_yt_video_fail)
 async def stats_yt_fail(link):
-    client = redis.from_url(str(settings.redis_dsn), decode_responses=True)
-    try:
-        await _incr(client, f"stats:{_today()}:fail:youtube")
-    finally:
-        await client.aclose()
+    _buffer().add("fail:youtube")
 
 
 @signal_handler(on_social_video_fail)
 async def stats_social_fail(link):
-    client = redis.from_url(str(settings.redis_dsn), decode_responses=True)
-    try:
-        await _incr(client, f"stats:{_today()}:fail:social")
-    finally:
-        await client.aclose()
+    _buffer().add("fail:social")
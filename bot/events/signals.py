@@ -1,5 +1,79 @@
+import asyncio
+import logging
+import threading
+import weakref
+from collections.abc import Awaitable, Callable, Coroutine
+from typing import Any
+
 from aiosignal import Signal
 
+log = logging.getLogger(__name__)
+
+
+class EventSignal(Signal):
+    """
+    A Signal whose send() hands the handlers to a background task and returns
+    right away, so analytics and logging never sit between a user's message
+    and the bot's reply. Handlers still run one after another, in order; one
+    failing is logged and doesn't stop the rest.
+    """
+
+    __slots__ = ()
+
+    async def send(self, *args: Any, **kwargs: Any) -> None:
+        if not self.frozen:
+            raise RuntimeError("Cannot send non-frozen signal.")
+        if self:
+            spawn(self._dispatch(args, kwargs))
+
+    async def _dispatch(self, args: tuple, kwargs: dict) -> None:
+        for receiver in self:
+            try:
+                await receiver(*args, **kwargs)
+            except Exception:
+                log.exception("%s handler %s failed", self._owner, getattr(receiver, "__qualname__", receiver))
+
+
+# Background tasks per event loop. The worker runs one loop per thread, so each
+# thread only ever touches its own set; the lock guards the mapping itself.
+_tasks: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, set[asyncio.Task]] = weakref.WeakKeyDictionary()
+_tasks_lock = threading.Lock()
+_flushers: list[Callable[[], Awaitable[None]]] = []
+
+
+def _loop_tasks() -> set[asyncio.Task]:
+    loop = asyncio.get_running_loop()
+    with _tasks_lock:
+        return _tasks.setdefault(loop, set())
+
+
+def spawn(coro: Coroutine[Any, Any, None]) -> asyncio.Task:
+    """Runs `coro` in the background on the current loop; drain_events() waits for it."""
+    tasks = _loop_tasks()
+    task = asyncio.create_task(coro)
+    tasks.add(task)
+    task.add_done_callback(tasks.discard)
+    return task
+
+
+def flush_handler[F: Callable[[], Awaitable[None]]](func: F) -> F:
+    """Registers a coroutine function writing out whatever handlers buffered; drain_events() calls it."""
+    _flushers.append(func)
+    return func
+
+
+async def drain_events() -> None:
+    """
+    Waits for the handlers in flight on this loop, then flushes their buffers.
+    For when the loop is about to go idle or away: at the end of a threaded
+    worker's job and on shutdown.
+    """
+    tasks = _loop_tasks()
+    while pending := [t for t in tasks if not t.done()]:
+        await asyncio.wait(pending)
+    for flush in _flushers:
+        await flush()
+
 
 def signal_handler(signal: Signal):
     def decorator(func):
@@ -18,17 +92,17 @@ def freeze_signals():
         sig.freeze()
 
 
-on_yt_video_sent = Signal(
+on_yt_video_sent = EventSignal(
     "on_yt_video_sent(link: str, chat_id: int, chat_type: str, bot: Bot, video: YouTubeVideoData, fresh: bool)"
 )
-on_yt_video_fail = Signal(
+on_yt_video_fail = EventSignal(
     "on_yt_video_fail(link: str)"
 )
-on_social_video_sent = Signal(
+on_social_video_sent = EventSignal(
     "on_social_video_sent(link: str, chat_id: int, chat_type: str, bot: Bot, video: SocialVideoData, fresh: bool)"
 )
-on_social_video_fail = Signal(
+on_social_video_fail = EventSignal(
     "on_social_video_fail(link: str)"
 )
-on_link_sent = Signal("on_link_sent(link: str, message: Message, origin: LinkOrigin)")
-on_link_received = Signal("on_link_received(message: Message, origin: LinkOrigin)")
+on_link_sent = EventSignal("on_link_sent(link: str, message: Message, origin: LinkOrigin)")
+on_link_received = EventSignal("on_link_received(message: Message, origin: LinkOrigin)")
@@ -4,8 +4,9 @@ import re
 
 from aiogram import F, types
 from aiogram.exceptions import TelegramBadRequest
-from aiogram.filters import Command, CommandStart
+from aiogram.filters import Command, CommandObject, CommandStart
 from aiogram.types import ErrorEvent, Message
+from pydantic import BaseModel
 
 from .config import settings
 from .dispatcher import router
@@ -13,19 +14,21 @@ from .enum import LinkOrigin
 from .events import on_link_received, on_social_video_sent, on_yt_video_sent
 from .util.audio.pager import redeliver_page
 from .util.audio.schema import AudioRequestData
+from .util.cache import cache_delete, cache_get, cache_set, local_cache, negative_key
 from .util.chat import is_group_chat
+from .util.codec import decode, encode
 from .util.redis import redis_client
 from .util.social.schema import SocialVideoData
 from .util.stats import build_stats_report
 from .util.youtube.enum import TargetLang
 from .util.youtube.schema import YouTubeVideoData
-from .worker.actors import (
+from .worker.messages import (
     process_audio_page,
     process_social_link,
     process_youtube_audio,
     process_youtube_link,
 )
-from .worker.waiters import Waiter, register_waiter
+from .worker.waiters import Waiter, lookup_or_register_waiter, register_waiter
 
 log = logging.getLogger(__name__)
 
@@ -69,10 +72,29 @@ async def start_channel(message: types.Message) -> None:
 
 
 @router.message(Command("stats"))
-async def cmd_stats(message: types.Message):
+async def cmd_stats(message: types.Message, command: CommandObject):
     if not settings.admin_chat_id or message.chat.id != settings.admin_chat_id:
         return
-    await message.reply(await build_stats_report())
+    await message.reply(await build_stats_report(command.args))
+
+
+async def _get_entry[M: BaseModel](model_cls: type[M], key: str) -> M | None:
+    """A cache entry from the local cache, else from Redis (and then kept locally)."""
+    if (entry := local_cache.get(key, model_cls)) is not None:
+        return entry
+    read_started = local_cache.read_started()
+    raw = await cache_get(redis_client, key)
+    if not raw:
+        return None
+    local_cache.put(key, raw, read_started)
+    return decode(model_cls, raw)
+
+
+async def _reply_known_failure(message: Message, cache_key: str, text: str) -> None:
+    log.info("%s failed recently, answering from the negative cache", cache_key)
+    if not is_group_chat(message.chat.id):
+        # stay quiet in groups/supergroups/channels, as the workers do
+        await message.reply(text)
 
 
 @router.message(
@@ -93,30 +115,46 @@ async def embed_youtube_videos(message: types.Message):
         target_lang = TargetLang.ORIGINAL
 
     video = YouTubeVideoData.model_validate(dict(link=link, target_lang=target_lang))
+    waiter = Waiter(
+        chat_id=message.chat.id,
+        chat_type=message.chat.type,
+        reply_to_message_id=message.message_id,
+    )
 
-    if video_raw := await redis_client.get(video.cache_key):
-        cached = YouTubeVideoData.model_validate_json(video_raw)
+    is_first = False
+    cached = local_cache.get(video.cache_key, YouTubeVideoData)
+    if cached is None:
+        read_started = local_cache.read_started()
+        lookup = await lookup_or_register_waiter(
+            redis_client, [negative_key(video.cache_key), video.cache_key], video.cache_key, waiter,
+            _YOUTUBE_WAITERS_TTL,
+        )
+        if lookup.key == negative_key(video.cache_key):
+            await _reply_known_failure(message, video.cache_key, lookup.value)
+            return
+        is_first = lookup.is_first
+        if lookup.value:
+            local_cache.put(video.cache_key, lookup.value, read_started)
+            cached = decode(YouTubeVideoData, lookup.value)
+    if cached is not None:
         log.info("cache hit for %s", video.cache_key)
         if await asyncio.to_thread(cached.ensure_metadata):
             # promote a pre-metadata entry so the next hit skips YouTube entirely
-            await redis_client.set(video.cache_key, cached.model_dump_json())
+            await cache_set(redis_client, video.cache_key, encode(cached))
         try:
             await cached.reply_to(message)
         except TelegramBadRequest:
             log.info("cached telegram file ids failed to be posted, removing from cache")
-            await redis_client.delete(video.cache_key)
+            await cache_delete(redis_client, video.cache_key)
+            is_first = await register_waiter(redis_client, video.cache_key, waiter, _YOUTUBE_WAITERS_TTL)
         else:
             await on_yt_video_sent.send(link, message.chat.id, message.chat.type, message.bot, cached, False)
             return
 
-    log.info("cache miss for %s, registering waiter", video.cache_key)
-    waiter = Waiter(
-        chat_id=message.chat.id,
-        chat_type=message.chat.type,
-        reply_to_message_id=message.message_id,
-    )
-    is_first = await register_waiter(redis_client, video.cache_key, waiter, _YOUTUBE_WAITERS_TTL)
+    log.info("cache miss for %s, waiter registered", video.cache_key)
     if is_first:
+        # always the regular queue: the worker knows the duration once it has
+        # fetched the video, and moves long ones to youtube_long itself
         process_youtube_link.send(message.chat.id, link, target_lang.value)
 
 
@@ -129,8 +167,8 @@ async def get_audio(callback: types.CallbackQuery):
     video_id = callback.data.removeprefix("aud:")
     cache_key = f"yt:{video_id}"
 
-    video_raw = await redis_client.get(cache_key)
-    if not video_raw:
+    video = await _get_entry(YouTubeVideoData, cache_key)
+    if video is None:
         if not is_group_chat(callback.message.chat.id):
             await callback.message.reply("❌ This video is no longer cached, please resend the link.")
         return
@@ -141,11 +179,10 @@ async def get_audio(callback: types.CallbackQuery):
     except TelegramBadRequest:
         pass
 
-    video = YouTubeVideoData.model_validate_json(video_raw)
     if video.audio_file_id:
         if await asyncio.to_thread(video.ensure_metadata):
             # promote a pre-metadata entry so the next tap skips YouTube entirely
-            await redis_client.set(cache_key, video.model_dump_json())
+            await cache_set(redis_client, cache_key, encode(video))
         await callback.message.answer_audio(
             video.audio_file_id,
             performer=video.author,
@@ -155,13 +192,19 @@ async def get_audio(callback: types.CallbackQuery):
         return
 
     log.info("cache miss for audio %s, registering waiter", cache_key)
+    audio_key = f"{cache_key}:audio"
     waiter = Waiter(
         chat_id=callback.message.chat.id,
         chat_type=callback.message.chat.type,
         reply_to_message_id=callback.message.message_id,
     )
-    is_first = await register_waiter(redis_client, f"{cache_key}:audio", waiter, _YOUTUBE_WAITERS_TTL)
-    if is_first:
+    lookup = await lookup_or_register_waiter(
+        redis_client, [negative_key(audio_key)], audio_key, waiter, _YOUTUBE_WAITERS_TTL,
+    )
+    if lookup.value:
+        await _reply_known_failure(callback.message, audio_key, lookup.value)
+        return
+    if lookup.is_first:
         process_youtube_audio.send(callback.message.chat.id, video_id, callback.message.message_id)
 
 
@@ -187,13 +230,12 @@ async def get_audio_page(callback: types.CallbackQuery):
     except TelegramBadRequest:
         pass
 
-    audio_raw = await redis_client.get(cache_key)
-    if not audio_raw:
+    audio = await _get_entry(AudioRequestData, cache_key)
+    if audio is None:
         if not is_group_chat(callback.message.chat.id):
             await callback.message.reply("❌ This playlist is no longer cached, please resend the link.")
         return
 
-    audio = AudioRequestData.model_validate_json(audio_raw)
     page_tracks = audio.page(page)
     if all(t.file_id for t in page_tracks):
         await redeliver_page(
@@ -215,33 +257,52 @@ async def get_audio_page(callback: types.CallbackQuery):
 
 async def _process_social_url(message: Message, url: str) -> None:
     audio = AudioRequestData(link=url)
-    if audio_raw := await redis_client.get(audio.cache_key):
-        cached_audio = AudioRequestData.model_validate_json(audio_raw)
+    video = SocialVideoData.model_validate(dict(link=url))
+    waiter = Waiter(
+        chat_id=message.chat.id,
+        chat_type=message.chat.type,
+        reply_to_message_id=message.message_id,
+    )
+
+    # an audio link may already be cached as a playlist, anything else as a video
+    is_first = False
+    cached_audio = local_cache.get(audio.cache_key, AudioRequestData)
+    cached = local_cache.get(video.cache_key, SocialVideoData)
+    if cached_audio is None and cached is None:
+        read_started = local_cache.read_started()
+        lookup = await lookup_or_register_waiter(
+            redis_client, [negative_key(video.cache_key), audio.cache_key, video.cache_key], video.cache_key, waiter,
+            _SOCIAL_WAITERS_TTL,
+        )
+        if lookup.key == negative_key(video.cache_key):
+            await _reply_known_failure(message, video.cache_key, lookup.value)
+            return
+        is_first = lookup.is_first
+        if lookup.key == audio.cache_key:
+            local_cache.put(audio.cache_key, lookup.value, read_started)
+            cached_audio = decode(AudioRequestData, lookup.value)
+        elif lookup.value:
+            local_cache.put(video.cache_key, lookup.value, read_started)
+            cached = decode(SocialVideoData, lookup.value)
+
+    if cached_audio is not None:
         log.info("cache hit (audio) for %s", audio.cache_key)
         await redeliver_page(redis_client, message.bot, message.chat.id, message.message_id, cached_audio, page=1)
         return
 
-    video = SocialVideoData.model_validate(dict(link=url))
-
-    if video_raw := await redis_client.get(video.cache_key):
-        cached = SocialVideoData.model_validate_json(video_raw)
+    if cached is not None:
         log.info("cache hit for %s", video.cache_key)
         try:
             await cached.reply_to(message)
         except TelegramBadRequest:
             log.info("cached file ids invalid, clearing cache for %s", video.cache_key)
-            await redis_client.delete(video.cache_key)
+            await cache_delete(redis_client, video.cache_key)
+            is_first = await register_waiter(redis_client, video.cache_key, waiter, _SOCIAL_WAITERS_TTL)
         else:
             await on_social_video_sent.send(url, message.chat.id, message.chat.type, message.bot, cached, False)
             return
 
-    log.info("cache miss for %s, registering waiter", video.cache_key)
-    waiter = Waiter(
-        chat_id=message.chat.id,
-        chat_type=message.chat.type,
-        reply_to_message_id=message.message_id,
-    )
-    is_first = await register_waiter(redis_client, video.cache_key, waiter, _SOCIAL_WAITERS_TTL)
+    log.info("cache miss for %s, waiter registered", video.cache_key)
     if is_first:
         process_social_link.send(message.chat.id, url)
 
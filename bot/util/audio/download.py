@@ -36,7 +36,7 @@ def probe_link(url: str) -> tuple[bool, list[AudioTrackData]]:
     """
     Classifies `url` as audio-only or not, and builds its (capped) track index.
 
-    Synchronous/blocking -- call via asyncio.to_thread.
+    Synchronous/blocking -- call via run_blocking.
     """
     opts: Any = {"quiet": True, "skip_download": True, "extract_flat": "in_playlist", "noplaylist": False}
     with yt_dlp.YoutubeDL(opts) as ydl:
@@ -98,7 +98,7 @@ def probe_link(url: str) -> tuple[bool, list[AudioTrackData]]:
 
 
 def download_track(track: AudioTrackData, output_dir: Path) -> Path:
-    """Synchronous/blocking -- call via asyncio.to_thread."""
+    """Synchronous/blocking -- call via run_blocking."""
     ydl_opts: Any = {
         "outtmpl": str(output_dir / f"{track.extractor}_{track.id}.%(ext)s"),
         "format": "bestaudio/best",
@@ -122,7 +122,9 @@ def download_track(track: AudioTrackData, output_dir: Path) -> Path:
     file_path = Path(info["requested_downloads"][0]["filepath"])
     if file_path.stat().st_size > MAX_FILE_SIZE_BYTES:
         file_path.unlink(missing_ok=True)
-        raise AudioDownloadError(f"{track.title or track.webpage_url} is too large to send (over 50MB)")
+        raise AudioDownloadError(
+            f"{track.title or track.webpage_url} is too large to send (over {MAX_FILE_SIZE_BYTES // 1024 // 1024}MB)"
+        )
 
     log.info("downloaded track %s -> %s", track.webpage_url, file_path)
     return file_path
@@ -6,6 +6,7 @@ from aiogram import Bot
 from aiogram.exceptions import TelegramBadRequest
 
 from bot.util.audio.schema import AudioRequestData
+from bot.util.cache import cache_get, cache_set
 
 log = logging.getLogger(__name__)
 
@@ -18,11 +19,11 @@ async def redeliver_page(
     redis_client: redis.Redis, bot: Bot, chat_id: int, root_message_id: int, audio: AudioRequestData, page: int,
 ) -> None:
     key = _messages_key(chat_id, root_message_id)
-    old_raw = await redis_client.get(key)
+    old_raw = await cache_get(redis_client, key)
     old_ids: list[int] = json.loads(old_raw) if old_raw else []
 
     new_ids = await audio.send_to_chat(bot, chat_id, reply_to_message_id=root_message_id, page=page)
-    await redis_client.set(key, json.dumps(new_ids))
+    await cache_set(redis_client, key, json.dumps(new_ids))
 
     for message_id in old_ids:
         try:
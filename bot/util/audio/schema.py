@@ -1,9 +1,10 @@
 import hashlib
 import math
+from collections.abc import Sequence
 from typing import cast
 
 from aiogram import Bot, types
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_serializer
 
 from bot.util.chat import is_group_chat
 
@@ -38,6 +39,11 @@ class AudioRequestData(BaseModel):
     link: str
     tracks: list[AudioTrackData] = Field(default_factory=list)
 
+    @field_serializer("tracks")
+    def _dump_tracks(self, tracks: Sequence[AudioTrackData]) -> list[AudioTrackData]:
+        # a cache hit's tracks are a lazily decoded sequence (bot.util.codec), not a list
+        return list(tracks)
+
     @property
     def hash16(self) -> str:
         return hashlib.sha256(self.link.encode()).hexdigest()[:16]
@@ -0,0 +1,322 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from contextlib import suppress
+
+import redis.asyncio as redis
+from pydantic import BaseModel
+from redis.exceptions import RedisError, ResponseError
+
+from bot.config import settings
+from bot.dispatcher import dp
+from bot.util.codec import decode
+from bot.util.redis import redis_client as bot_redis_client
+
+log = logging.getLogger(__name__)
+
+_DAY = 24 * 60 * 60
+
+# TTL per cache key prefix; more specific prefixes first (da:msgs: before da:)
+CACHE_TTLS: dict[str, int] = {
+    "da:msgs:": settings.cache_pager_ttl_days * _DAY,
+    "yt:": settings.cache_youtube_ttl_days * _DAY,
+    "dl:": settings.cache_social_ttl_days * _DAY,
+    "da:": settings.cache_audio_ttl_days * _DAY,
+    "au:": settings.cache_audio_ttl_days * _DAY,
+}
+
+# per-job keys living next to a cache entry; always written with a TTL, so one
+# without is a leftover of a crash or an older release
+_JOB_KEY_SUFFIXES = (":waiters", ":lock", ":checkpoint")
+
+USAGE_KEY = "cache:usage"
+_SCAN_COUNT = 1000
+# every write/delete of a cache entry is announced here, see LocalCache
+INVALIDATE_CHANNEL = "cache:invalidate"
+
+
+def cache_prefix(key: str) -> str | None:
+    for prefix in CACHE_TTLS:
+        if key.startswith(prefix):
+            return prefix
+    return None
+
+
+def cache_ttl(key: str) -> int | None:
+    prefix = cache_prefix(key)
+    return CACHE_TTLS[prefix] if prefix else None
+
+
+async def cache_get(redis_client: redis.Redis, key: str) -> str | None:
+    """GET that also pushes the entry's expiry back out, so entries in use never expire."""
+    ttl = cache_ttl(key)
+    if ttl is None:
+        return await redis_client.get(key)
+    return await redis_client.getex(key, ex=ttl)
+
+
+async def cache_set(redis_client: redis.Redis, key: str, value: str) -> None:
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.set(key, value, ex=cache_ttl(key))
+        pipe.publish(INVALIDATE_CHANNEL, key)
+        await pipe.execute()
+
+
+async def cache_delete(redis_client: redis.Redis, key: str) -> None:
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.delete(key)
+        pipe.publish(INVALIDATE_CHANNEL, key)
+        await pipe.execute()
+
+
+def negative_key(cache_key: str) -> str:
+    return f"neg:{cache_key}"
+
+
+async def remember_failure(redis_client: redis.Redis, cache_key: str, text: str) -> None:
+    """
+    Negative cache: remembers for a while that `cache_key` can't be produced
+    (private/removed/age-restricted video...) along with the user-facing
+    text, so the handlers answer the next request for it right away instead
+    of spending a worker slot -- and a YouTube probe -- to fail again.
+    """
+    await redis_client.set(negative_key(cache_key), text, ex=settings.cache_negative_ttl)
+
+
+class LocalCache:
+    """
+    Small LRU of cache entries, kept in the bot process in front of Redis, so
+    a link that hundreds of chats send within the hour is served without a
+    Redis round-trip.
+
+    Entries are dropped when any process writes or deletes their key (they
+    announce it on INVALIDATE_CHANNEL), and after a short TTL as a backstop.
+    The cache only works while the invalidation listener is subscribed: a
+    stale entry must never outlive a write we didn't hear about.
+
+    An invalidation can also arrive while a handler is still reading the old
+    value from Redis. So handlers take a read_started() token before the read
+    and pass it to put(), which drops values read before the key's latest
+    invalidation.
+
+    An entry is decoded on its first get() and kept decoded. Each get()
+    returns a shallow copy, so a handler filling in fields before saving the
+    entry (ensure_metadata) doesn't change it for the others. Lists are
+    shared: never edit them in place.
+    """
+
+    def __init__(self, size: int, ttl: float) -> None:
+        self.size = size
+        self.ttl = ttl
+        self.active = False
+        self._entries: OrderedDict[str, tuple[float, str | BaseModel]] = OrderedDict()
+        self._generation = 0
+        # generation of each key's latest invalidation; past `size * 4` keys the
+        # oldest are forgotten and `_floor` stands in for all of them
+        self._invalidated: OrderedDict[str, int] = OrderedDict()
+        self._floor = 0
+
+    def get[M: BaseModel](self, key: str, model_cls: type[M]) -> M | None:
+        entry = self._entries.get(key) if self.active else None
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        if not isinstance(value, model_cls):
+            value = decode(model_cls, value)
+            self._entries[key] = (expires_at, value)
+        return value.model_copy()
+
+    def read_started(self) -> int:
+        """A token for put(): take it before reading the value from Redis."""
+        return self._generation
+
+    def put(self, key: str, raw: str, read_started: int) -> None:
+        """Keeps `raw`, as read from Redis, unless the key was invalidated since `read_started`."""
+        stale = read_started < max(self._floor, self._invalidated.get(key, 0))
+        if self.active and not stale:
+            self._entries[key] = (time.monotonic() + self.ttl, raw)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def discard(self, key: str) -> None:
+        self._generation += 1
+        self._entries.pop(key, None)
+        self._invalidated[key] = self._generation
+        self._invalidated.move_to_end(key)
+        while len(self._invalidated) > self.size * 4:
+            _, generation = self._invalidated.popitem(last=False)
+            self._floor = max(self._floor, generation)
+
+    def clear(self) -> None:
+        # whatever was being read when we stopped hearing about writes is suspect too
+        self._generation += 1
+        self._floor = self._generation
+        self._invalidated.clear()
+        self._entries.clear()
+
+
+local_cache = LocalCache(settings.cache_local_size, settings.cache_local_ttl)
+
+
+async def check_eviction_policy(redis_client: redis.Redis) -> None:
+    """
+    Warns when Redis itself may evict keys. Cache entries aren't the only keys
+    with a TTL: job locks, waiter lists, checkpoints, rate limiter buckets and
+    stats have one too, and losing those means duplicate jobs, users who never
+    get an answer or uploads started over. The cache budget is kept by
+    sweep_cache instead, which only ever evicts cache entries.
+    """
+    try:
+        policy = (await redis_client.config_get("maxmemory-policy")).get("maxmemory-policy")
+    except ResponseError:
+        return  # managed Redis often disables CONFIG
+    if policy and policy != "noeviction":
+        log.warning(
+            "redis maxmemory-policy is %s: under memory pressure it may evict job locks, waiters "
+            "and checkpoints along with the cache; use noeviction and CACHE_MAX_MEMORY_MB instead",
+            policy,
+        )
+
+
+async def sweep_cache(redis_client: redis.Redis) -> dict[str, dict[str, int]]:
+    """
+    One SCAN pass over the cache keyspace. Entries written without a TTL (by
+    releases before TTLs existed) get their prefix's TTL, and waiter/lock/
+    checkpoint keys without one are deleted as orphans. Past
+    settings.cache_max_memory_mb, the least recently used entries are deleted
+    until the cache fits again -- entries only, never the job keys next to
+    them. Returns (and stores under USAGE_KEY for /stats) the key count and
+    bytes used per prefix.
+    """
+    budget = (settings.cache_max_memory_mb or 0) * 1024 * 1024
+    usage = {prefix: {"keys": 0, "bytes": 0} for prefix in CACHE_TTLS}
+    # (seconds idle, bytes, key) of every entry, when there is a budget to keep
+    entries: list[tuple[int, int, str]] = []
+    expired = orphans = 0
+    cursor = 0
+    while True:
+        cursor, keys = await redis_client.scan(cursor, count=_SCAN_COUNT)
+        keys = [k for k in keys if cache_prefix(k)]
+        if keys:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    # none of these count as an access, so they don't skew the LRU order
+                    pipe.ttl(key)
+                    pipe.memory_usage(key)
+                    pipe.object("idletime", key)
+                results = await pipe.execute(raise_on_error=False)
+
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for key, ttl, size, idle in zip(keys, results[::3], results[1::3], results[2::3], strict=True):
+                    prefix = cache_prefix(key)
+                    usage[prefix]["keys"] += 1
+                    if isinstance(size, int):
+                        usage[prefix]["bytes"] += size
+                    is_job_key = key.endswith(_JOB_KEY_SUFFIXES)
+                    if budget and not is_job_key and isinstance(size, int) and isinstance(idle, int):
+                        entries.append((idle, size, key))
+                    if ttl != -1:
+                        continue
+                    if is_job_key:
+                        pipe.delete(key)
+                        orphans += 1
+                    else:
+                        pipe.expire(key, CACHE_TTLS[prefix])
+                        expired += 1
+                await pipe.execute()
+        if cursor == 0:
+            break
+
+    evicted = await _evict_over_budget(redis_client, usage, entries, budget) if budget else 0
+    await redis_client.set(USAGE_KEY, json.dumps(usage))
+    log.info(
+        "cache sweep: %d entries given a TTL, %d orphaned keys removed, %d entries evicted",
+        expired, orphans, evicted,
+    )
+    return usage
+
+
+async def _evict_over_budget(
+    redis_client: redis.Redis,
+    usage: dict[str, dict[str, int]],
+    entries: list[tuple[int, int, str]],
+    budget: int,
+) -> int:
+    """Deletes the longest idle entries until the cache fits in `budget` bytes; updates `usage`."""
+    total = sum(u["bytes"] for u in usage.values())
+    if total <= budget:
+        return 0
+    evicted = 0
+    entries.sort(reverse=True)
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for _, size, key in entries:
+            if total <= budget:
+                break
+            pipe.delete(key)
+            pipe.publish(INVALIDATE_CHANNEL, key)
+            prefix = cache_prefix(key)
+            usage[prefix]["keys"] -= 1
+            usage[prefix]["bytes"] -= size
+            total -= size
+            evicted += 1
+        await pipe.execute()
+    return evicted
+
+
+async def read_usage(redis_client: redis.Redis) -> dict[str, dict[str, int]]:
+    raw = await redis_client.get(USAGE_KEY)
+    return json.loads(raw) if raw else {}
+
+
+async def _maintain_cache() -> None:
+    await check_eviction_policy(bot_redis_client)
+    while True:
+        try:
+            await sweep_cache(bot_redis_client)
+        except RedisError as e:
+            log.warning("cache sweep failed: %r", e)
+        await asyncio.sleep(settings.cache_sweep_interval)
+
+
+async def _listen_for_invalidations() -> None:
+    while True:
+        try:
+            async with bot_redis_client.pubsub() as pubsub:
+                await pubsub.subscribe(INVALIDATE_CHANNEL)
+                # whatever was written while we weren't listening went unheard
+                local_cache.clear()
+                local_cache.active = True
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        local_cache.discard(message["data"])
+        except RedisError as e:
+            log.warning("lost the cache invalidation channel, local cache off until it's back: %r", e)
+        finally:
+            local_cache.active = False
+            local_cache.clear()
+        await asyncio.sleep(1)
+
+
+_background: list[asyncio.Task] = []
+
+
+@dp.startup()
+async def on_startup(*args: object, **kwargs: object) -> None:
+    _background.append(asyncio.create_task(_maintain_cache()))
+    _background.append(asyncio.create_task(_listen_for_invalidations()))
+
+
+@dp.shutdown()
+async def on_shutdown(*args: object, **kwargs: object) -> None:
+    for task in _background:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    _background.clear()
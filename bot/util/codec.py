@@ -0,0 +1,135 @@
+"""
+Compact encoding for cache entries.
+
+Flat entries are JSON without their default fields. Entries with list-of-model
+fields (a playlist's tracks) are msgpack maps keyed by append-only integer
+tags -- never renumber or reuse one -- and zstd-compressed past
+_COMPRESS_OVER, behind a one-byte header; their items are decoded on first
+access. Plain model_dump_json() entries are read too.
+"""
+from collections.abc import Sequence
+from typing import Any, overload
+
+import msgpack
+import zstandard
+from pydantic import BaseModel
+
+from bot.util.audio.schema import AudioRequestData, AudioTrackData
+from bot.util.social.schema import SocialVideoData
+from bot.util.youtube.schema import YouTubeVideoData
+
+_MSGPACK = 0x01
+_MSGPACK_ZSTD = 0x02
+_COMPRESS_OVER = 1024  # bytes; below this zstd's frame overhead eats the gain
+
+
+class _Layout:
+    def __init__(self, tags: dict[str, int], nested: dict[str, type[BaseModel]] | None = None) -> None:
+        self.tags = tags
+        self.names = {tag: name for name, tag in tags.items()}
+        self.nested = nested or {}  # list-of-model fields, decoded lazily
+
+
+_LAYOUTS: dict[type[BaseModel], _Layout] = {
+    YouTubeVideoData: _Layout({
+        "link": 0, "target_lang": 1, "file_ids": 2, "width": 3, "height": 4, "source_lang": 5,
+        "translated_lang": 6, "audio_file_id": 7, "title": 8, "author": 9, "length": 10,
+    }),
+    SocialVideoData: _Layout(
+        {"link": 0, "origin": 1, "file_ids": 2, "video_id": 3, "width": 4, "height": 5, "title": 6},
+    ),
+    AudioTrackData: _Layout(
+        {"extractor": 0, "id": 1, "webpage_url": 2, "title": 3, "uploader": 4, "duration": 5, "file_id": 6},
+    ),
+    AudioRequestData: _Layout({"link": 0, "tracks": 1}, nested={"tracks": AudioTrackData}),
+}
+
+
+class _LazyList[M: BaseModel](Sequence[M]):
+    """A list-of-model field whose items are decoded on first access (and then kept, so edits stick)."""
+
+    def __init__(self, model_cls: type[M], blobs: list[bytes]) -> None:
+        self._model_cls = model_cls
+        self._blobs = blobs
+        self._items: list[M | None] = [None] * len(blobs)
+
+    def __len__(self) -> int:
+        return len(self._blobs)
+
+    @overload
+    def __getitem__(self, index: int) -> M: ...
+    @overload
+    def __getitem__(self, index: slice) -> list[M]: ...
+    def __getitem__(self, index: int | slice) -> M | list[M]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        item = self._items[index]
+        if item is None:
+            raw = msgpack.unpackb(self._blobs[index], strict_map_key=False)
+            item = self._items[index] = _unpack(self._model_cls, raw)
+        return item
+
+    def blobs(self) -> list[bytes]:
+        """Items packed for storage; untouched ones are passed through without a decode/encode round."""
+        return [
+            blob if item is None else msgpack.packb(_pack(item), use_bin_type=True)
+            for blob, item in zip(self._blobs, self._items, strict=True)
+        ]
+
+
+def _pack(model: BaseModel) -> dict[int | str, Any]:
+    layout = _LAYOUTS[type(model)]
+    packed: dict[int | str, Any] = {}
+    for name, field in type(model).model_fields.items():
+        value = getattr(model, name)
+        if name in layout.nested:
+            if isinstance(value, _LazyList):
+                value = value.blobs()
+            else:
+                value = [msgpack.packb(_pack(item), use_bin_type=True) for item in value]
+            if not value:
+                continue
+        elif value is None or value == field.get_default(call_default_factory=True):
+            continue
+        packed[layout.tags.get(name, name)] = value
+    return packed
+
+
+def _unpack[M: BaseModel](model_cls: type[M], packed: dict[int | str, Any]) -> M:
+    layout = _LAYOUTS[model_cls]
+    values = {layout.names.get(key, key): value for key, value in packed.items()}
+    lazy = {name: values.pop(name) for name in layout.nested if name in values}
+    # validating the handful of scalar fields in pydantic-core is faster than
+    # model_construct() in Python, and converts the enums for us
+    model = model_cls.model_validate(values)
+    for name, blobs in lazy.items():
+        setattr(model, name, _LazyList(layout.nested[name], blobs))
+    return model
+
+
+def encode(model: BaseModel) -> str:
+    """
+    Encodes a cache entry. Returns str, as the Redis clients expect: they use
+    encoding_errors="surrogateescape", which carries msgpack bytes unchanged.
+    """
+    if not _LAYOUTS[type(model)].nested:
+        return model.model_dump_json(exclude_defaults=True)
+    body = msgpack.packb(_pack(model), use_bin_type=True)
+    if len(body) > _COMPRESS_OVER:
+        data = bytes([_MSGPACK_ZSTD]) + zstandard.compress(body, 3)
+    else:
+        data = bytes([_MSGPACK]) + body
+    return data.decode("utf-8", "surrogateescape")
+
+
+def decode[M: BaseModel](model_cls: type[M], raw: str | bytes) -> M:
+    """Decodes a cache entry written by encode(), or by model_dump_json() before it."""
+    if isinstance(raw, str) and raw.startswith("{"):
+        return model_cls.model_validate_json(raw)  # no str -> bytes round for the common case
+    data = raw.encode("utf-8", "surrogateescape") if isinstance(raw, str) else raw
+    header, body = data[0], data[1:]
+    if header == _MSGPACK:
+        return _unpack(model_cls, msgpack.unpackb(body, strict_map_key=False))
+    if header == _MSGPACK_ZSTD:
+        return _unpack(model_cls, msgpack.unpackb(zstandard.decompress(body), strict_map_key=False))
+    return model_cls.model_validate_json(data)
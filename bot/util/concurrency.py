@@ -0,0 +1,63 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from bot.config import settings
+
+# Blocking work is bounded on two independent axes: the I/O pool caps how many
+# downloads/probes are in flight, the CPU slots cap how many of those may be
+# encoding at the same time. The two scale separately -- dozens of jobs can be
+# waiting on YouTube while only as many as there are cores are running ffmpeg.
+_io_executor = ThreadPoolExecutor(max_workers=settings.worker_io_threads, thread_name_prefix="blocking-io")
+_cpu_slots = threading.BoundedSemaphore(settings.worker_cpu_slots)
+# set once the coroutine awaiting a run_blocking call is cancelled
+_cancelled: contextvars.ContextVar[threading.Event | None] = contextvars.ContextVar("blocking_cancelled", default=None)
+
+
+async def run_blocking[**P, R](fn: Callable[P, R], *args: P.args, **kwargs: P.kwargs) -> R:
+    """asyncio.to_thread, but on the bounded I/O pool instead of the loop's default executor."""
+    loop = asyncio.get_running_loop()
+    cancelled = threading.Event()
+    ctx = contextvars.copy_context()
+    ctx.run(_cancelled.set, cancelled)
+    try:
+        return await loop.run_in_executor(_io_executor, functools.partial(ctx.run, fn, *args, **kwargs))
+    except asyncio.CancelledError:
+        # the thread itself can't be interrupted, but the subprocesses it
+        # waits on can (see bot.util.process)
+        cancelled.set()
+        raise
+
+
+def blocking_cancelled() -> threading.Event | None:
+    """Inside a run_blocking call: the event set when its caller gets cancelled."""
+    return _cancelled.get()
+
+
+@contextmanager
+def cpu_slot() -> Iterator[None]:
+    """Held around CPU-bound sections inside blocking code (already off the loop)."""
+    with _cpu_slots:
+        yield
+
+
+@contextmanager
+def cpu_slots(wanted: int) -> Iterator[int]:
+    """
+    Holds one CPU slot, waiting for it if need be, plus as many more as are
+    free right now, up to `wanted`; yields how many are held. For work that
+    can fan out over several cores but shouldn't wait for them.
+    """
+    _cpu_slots.acquire()
+    held = 1
+    try:
+        while held < wanted and _cpu_slots.acquire(blocking=False):
+            held += 1
+        yield held
+    finally:
+        for _ in range(held):
+            _cpu_slots.release()
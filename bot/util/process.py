@@ -0,0 +1,151 @@
+"""
+Subprocesses for the blocking stages (ffmpeg, vot-cli) that don't outlive
+their job.
+
+subprocess.run() in a run_blocking thread can't be interrupted: when
+dramatiq's time limit cancels the job, the thread -- and the encode it is
+waiting on -- carry on until ffmpeg is done. Processes started here run in
+their own process group and are killed, group and all, when their deadline
+passes or the job awaiting the thread is cancelled (see
+bot.util.concurrency.blocking_cancelled). The last lines of stderr are kept
+for the error raised, instead of being thrown away.
+"""
+import logging
+import os
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Sequence
+from typing import IO
+
+from bot.util.concurrency import blocking_cancelled
+
+log = logging.getLogger(__name__)
+
+_STDERR_LINES = 20
+_POLL_INTERVAL = 0.5  # seconds between deadline/cancellation checks
+
+# (seconds of output written so far, fraction done or None if the duration is unknown)
+ProgressCallback = Callable[[float, float | None], None]
+
+
+class ProcessFailed(subprocess.CalledProcessError):
+    def __str__(self) -> str:
+        return f"{super().__str__()}\n{self.stderr}" if self.stderr else super().__str__()
+
+
+class ProcessTimedOut(subprocess.TimeoutExpired):
+    def __str__(self) -> str:
+        return f"{super().__str__()}\n{self.stderr}" if self.stderr else super().__str__()
+
+
+class ProcessCancelled(Exception):
+    """The job waiting on the process was cancelled, and the process killed."""
+
+
+def _pump(stream: IO[str], on_line: Callable[[str], None]) -> None:
+    for line in stream:
+        on_line(line.rstrip("\n"))
+
+
+def run_process(
+    args: Sequence[str],
+    timeout: float | None = None,
+    on_stdout_line: Callable[[str], None] | None = None,
+) -> None:
+    """
+    Runs `args` to completion, like subprocess.run(args, check=True) with
+    output discarded, but killable: see the module docstring. Raises
+    ProcessFailed/ProcessTimedOut (subclasses of CalledProcessError and
+    TimeoutExpired, carrying the stderr tail) or ProcessCancelled.
+    """
+    stderr_tail: deque[str] = deque(maxlen=_STDERR_LINES)
+    process = subprocess.Popen(
+        args,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE if on_stdout_line else subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        errors="replace",
+        start_new_session=True,  # its own process group, so children die with it
+    )
+    pumps = [threading.Thread(target=_pump, args=(process.stderr, stderr_tail.append), daemon=True)]
+    if on_stdout_line:
+        pumps.append(threading.Thread(target=_pump, args=(process.stdout, on_stdout_line), daemon=True))
+    for pump in pumps:
+        pump.start()
+
+    deadline = time.monotonic() + timeout if timeout else None
+    cancelled = blocking_cancelled()
+    try:
+        while True:
+            try:
+                process.wait(_POLL_INTERVAL)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            if cancelled is not None and cancelled.is_set():
+                raise ProcessCancelled(f"{args[0]} cancelled along with its job")
+            if deadline is not None and time.monotonic() > deadline:
+                raise ProcessTimedOut(list(args), timeout, stderr="\n".join(stderr_tail))
+    except BaseException:
+        _kill(process)
+        raise
+    finally:
+        for pump in pumps:
+            pump.join(timeout=1)
+
+    if process.returncode:
+        raise ProcessFailed(process.returncode, list(args), stderr="\n".join(stderr_tail))
+
+
+def _kill(process: subprocess.Popen) -> None:
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+    log.info("killed %s (pid %d)", process.args[0], process.pid)
+
+
+def run_ffmpeg(
+    args: Sequence[str],
+    timeout: float | None = None,
+    duration: float | None = None,
+    on_progress: ProgressCallback | None = None,
+) -> None:
+    """
+    `ffmpeg -y <args>` through run_process, with `-progress` parsed into
+    `on_progress` calls -- one per progress block, about every half second.
+    `duration` (of the output, seconds) turns those into a fraction done.
+    """
+    block: dict[str, str] = {}
+
+    def on_line(line: str) -> None:
+        key, _, value = line.partition("=")
+        block[key] = value
+        if key != "progress":
+            return
+        out_time_us = block.get("out_time_us", "")
+        if on_progress and out_time_us.isdigit():
+            done = int(out_time_us) / 1_000_000
+            on_progress(done, min(1.0, done / duration) if duration else None)
+        block.clear()
+
+    command = ["ffmpeg", "-y", "-nostats", "-progress", "pipe:1", *args]
+    run_process(command, timeout, on_line if on_progress else None)
+
+
+def log_progress(label: str, step: float = 0.25) -> ProgressCallback:
+    """An on_progress that logs every `step` of the way."""
+    logged = 0.0
+
+    def on_progress(done: float, fraction: float | None) -> None:
+        nonlocal logged
+        if fraction is not None and fraction >= logged + step:
+            logged = fraction - fraction % step
+            log.info("%s: %d%% (%ds)", label, fraction * 100, done)
+
+    return on_progress
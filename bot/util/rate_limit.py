@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import random
+from typing import Any
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from redis.exceptions import RedisError
+
+from bot.config import settings
+from bot.util.chat import is_group_chat
+from bot.util.redis import current_redis_client, redis_client
+
+log = logging.getLogger(__name__)
+
+# Multi-bucket token bucket: takes `cost` tokens from every bucket at once, or
+# from none of them. KEYS come in (bucket, pause) pairs; ARGV is (rate/s,
+# capacity) per pair, then the cost. A cost above a bucket's capacity waits for
+# a full bucket and leaves it in debt, so the refill still pays for all of it.
+# A pause key is set from a 429's retry_after and blocks its bucket outright
+# until it expires. Returns 0 when the tokens were taken, otherwise how many ms
+# to wait before asking again. The clock is Redis' own, so the bot and every
+# worker agree on it.
+_ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local cost = tonumber(ARGV[#ARGV])
+local wait = 0
+local levels = {}
+for i = 1, #KEYS, 2 do
+    local rate = tonumber(ARGV[i])
+    local capacity = tonumber(ARGV[i + 1])
+    local paused = redis.call('PTTL', KEYS[i + 1])
+    if paused > wait then wait = paused end
+    local bucket = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate / 1000)
+    local needed = math.min(cost, capacity)
+    if tokens < needed then
+        local need = math.ceil((needed - tokens) * 1000 / rate)
+        if need > wait then wait = need end
+    end
+    levels[i] = tokens
+end
+if wait > 0 then return wait end
+for i = 1, #KEYS, 2 do
+    local rate = tonumber(ARGV[i])
+    local capacity = tonumber(ARGV[i + 1])
+    redis.call('HSET', KEYS[i], 'tokens', tostring(levels[i] - cost), 'ts', now)
+    redis.call('PEXPIRE', KEYS[i], math.ceil(capacity * 1000 / rate) + 1000)
+end
+return 0
+"""
+# EVALSHA through whichever client the caller runs on; the body is only sent
+# again if the server doesn't know the script yet
+_acquire_script = redis_client.register_script(_ACQUIRE_SCRIPT)
+
+# methods that put a new message into a chat -- what Telegram's per-chat limits count
+_CHAT_LIMITED_METHODS = frozenset({
+    "sendMessage", "sendVideo", "sendAudio", "sendMediaGroup", "sendPhoto", "sendDocument",
+    "sendVoice", "sendAnimation", "copyMessage", "forwardMessage",
+})
+_MAX_RETRY_AFTER_ATTEMPTS = 5
+
+
+class _Bucket:
+    def __init__(self, key: str, rate: float, capacity: float) -> None:
+        self.key = key
+        self.pause_key = f"{key}:pause"
+        self.rate = rate
+        self.capacity = capacity
+
+
+class TelegramRateLimiter(BaseRequestMiddleware):
+    """
+    aiogram session middleware that keeps every process calling the Bot API --
+    the bot and all worker threads -- under Telegram's limits together.
+
+    Each request first takes a token from the bot's global bucket and, for
+    message-sending methods, from the target chat's bucket (private chats and
+    groups have different limits). Buckets live in Redis, so they are shared
+    across processes. A 429 that still slips through (limits are undocumented
+    and vary) pauses the offending bucket for everyone for `retry_after`, and the
+    request is retried instead of failing the job.
+
+    Redis being unreachable never blocks a send: the limiter fails open.
+    """
+
+    def _buckets(self, bot: Bot, method: TelegramMethod[Any]) -> list[_Bucket]:
+        prefix = f"tg:rl:{bot.id}"
+        buckets = [_Bucket(f"{prefix}:global", settings.telegram_global_rate, settings.telegram_global_burst)]
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is not None and method.__api_method__ in _CHAT_LIMITED_METHODS:
+            if isinstance(chat_id, str) or is_group_chat(chat_id):
+                rate, burst = settings.telegram_group_rate, settings.telegram_group_burst
+            else:
+                rate, burst = settings.telegram_private_rate, settings.telegram_private_burst
+            buckets.append(_Bucket(f"{prefix}:chat:{chat_id}", rate, burst))
+        return buckets
+
+    @staticmethod
+    def _cost(method: TelegramMethod[Any]) -> int:
+        # an album is one request but as many messages, and Telegram counts messages
+        media = getattr(method, "media", None) if method.__api_method__ == "sendMediaGroup" else None
+        return max(1, len(media)) if isinstance(media, list) else 1
+
+    async def _acquire(self, buckets: list[_Bucket], cost: int) -> None:
+        client = current_redis_client()
+        keys: list[str] = []
+        args: list[float] = []
+        for bucket in buckets:
+            keys += [bucket.key, bucket.pause_key]
+            args += [bucket.rate, bucket.capacity]
+        args.append(cost)
+        while True:
+            try:
+                wait_ms = int(await _acquire_script(keys=keys, args=args, client=client))
+            except RedisError as e:
+                log.warning("rate limiter unavailable, sending unthrottled: %r", e)
+                return
+            if not wait_ms:
+                return
+            # jitter so waiters released together don't stampede the same refill
+            await asyncio.sleep(wait_ms / 1000 + random.uniform(0, 0.05))
+
+    async def _pause(self, bucket: _Bucket, retry_after: int) -> None:
+        try:
+            await current_redis_client().set(bucket.pause_key, 1, ex=max(retry_after, 1))
+        except RedisError as e:
+            log.warning("could not propagate a flood-control pause: %r", e)
+            await asyncio.sleep(retry_after)  # _acquire fails open, so wait it out here
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        buckets = self._buckets(bot, method)
+        cost = self._cost(method)
+        attempt = 0
+        while True:
+            await self._acquire(buckets, cost)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                if attempt >= _MAX_RETRY_AFTER_ATTEMPTS:
+                    raise
+                log.warning("flood control on %s, pausing for %ds", method.__api_method__, e.retry_after)
+                # the narrowest bucket is the one Telegram complained about
+                await self._pause(buckets[-1], e.retry_after)
@@ -1,15 +1,43 @@
 import logging
+from contextvars import ContextVar
 
 import redis.asyncio as redis
+from redis import Redis as SyncRedis
 
 from bot.config import settings
 from bot.dispatcher import dp
 
 log = logging.getLogger(__name__)
 
-redis_client: redis.Redis = redis.from_url(
-    str(settings.redis_dsn), decode_responses=True
-)
+
+def create_redis_client() -> redis.Redis:
+    # surrogateescape lets the binary cache entries of bot.util.codec pass
+    # through the str-decoding client byte-for-byte
+    return redis.from_url(str(settings.redis_dsn), decode_responses=True, encoding_errors="surrogateescape")
+
+
+redis_client: redis.Redis = create_redis_client()
+
+# For blocking code in threads (pytubefix lookups in run_blocking/to_thread),
+# which has no event loop to await on. Binary values, no decoding; the sync
+# pool is thread-safe, so one client serves every thread of the process.
+sync_redis_client: SyncRedis = SyncRedis.from_url(str(settings.redis_dsn))
+
+# Set by the dramatiq worker runtime (bot.worker.runtime) on each of its event
+# loop threads. redis-py's async pool can't be shared across event loops, so
+# code that runs in both processes (e.g. signal handlers) must go through
+# current_redis_client() rather than the module-level singleton above.
+_current_client: ContextVar[redis.Redis | None] = ContextVar("current_redis_client", default=None)
+
+
+def current_redis_client() -> redis.Redis:
+    """The Redis client bound to the calling thread's event loop: the worker
+    runtime's pooled client inside a dramatiq worker, the singleton otherwise."""
+    return _current_client.get() or redis_client
+
+
+def use_redis_client(client: redis.Redis) -> None:
+    _current_client.set(client)
 
 
 @dp.shutdown()
@@ -1,3 +1,13 @@
-from .download import DownloadResult, download_social_video
 from .exc import SocialDownloadError
 from .schema import SocialVideoData
+
+# the bot process imports .schema, which runs this module first; the
+# downloader pulls in yt_dlp, which only the worker needs, so it is imported
+# on first use
+
+
+def __getattr__(name: str) -> object:
+    if name in ("DownloadResult", "download_social_video"):
+        from . import download
+        return getattr(download, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
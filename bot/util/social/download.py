@@ -44,7 +44,7 @@ class DownloadResult:
 
 def download_social_video(url: str, output_dir: Path, max_res: int = settings.max_video_resolution) -> DownloadResult:
     """
-    Synchronous yt-dlp download. Call via asyncio.to_thread in the handler.
+    Synchronous yt-dlp download. Call via run_blocking in the handler.
 
     Raises SocialDownloadError for unrecoverable failures (private/removed/geo-blocked).
     """
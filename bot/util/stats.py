@@ -1,69 +1,46 @@
 import asyncio
+import logging
+import re
+from collections import Counter
+from contextlib import suppress
 from datetime import date, timedelta
 
+from redis.exceptions import RedisError, WatchError
+
 from bot.config import settings
+from bot.dispatcher import dp
+from bot.events.handlers.stats import (
+    ROLLUP_MARK_KEY,
+    STATS_TTL,
+    day_ms,
+    has_timeseries,
+    month_key,
+    series_key,
+    stats_key,
+    users_key,
+    week_key,
+)
+from bot.util.cache import read_usage
 from bot.util.redis import redis_client
 from bot.worker.broker import broker as dramatiq_broker
+from bot.worker.queues import QUEUES
 
+log = logging.getLogger(__name__)
 
-async def _queue_stats() -> dict:
-    namespace = dramatiq_broker.namespace
-    pending = await redis_client.hlen(f"{namespace}:default.msgs")
-    failed = await redis_client.zcard(f"{namespace}:default.XQ")
-    return {"pending": pending, "failed": failed}
-
-
-async def _period_stats(dates: list[str]) -> dict:
-    all_success_keys: list[str] = []
-    all_lang_keys: list[str] = []
-    for d in dates:
-        all_success_keys.extend(await redis_client.keys(f"stats:{d}:success:*"))
-        all_lang_keys.extend(await redis_client.keys(f"stats:{d}:lang:*"))
-    platforms = sorted({k.split(":")[-1] for k in all_success_keys})
-    langs = sorted({k.split(":")[-1] for k in all_lang_keys})
-
-    counter_keys: list[str] = []
-    for d in dates:
-        counter_keys += [
-            f"stats:{d}:requests",
-            f"stats:{d}:fail:youtube",
-            f"stats:{d}:fail:social",
-            f"stats:{d}:chat:private",
-            f"stats:{d}:chat:group",
-            f"stats:{d}:chat:supergroup",
-            f"stats:{d}:chat:channel",
-        ]
-        for platform in platforms:
-            counter_keys.append(f"stats:{d}:success:{platform}")
-        for lang in langs:
-            counter_keys.append(f"stats:{d}:lang:{lang}")
-
-    counter_map: dict[str, int] = {}
-    if counter_keys:
-        values = await redis_client.mget(counter_keys)
-        counter_map = {k: int(v or 0) for k, v in zip(counter_keys, values)}
-
-    user_ids: set[str] = set()
-    for d in dates:
-        members = await redis_client.smembers(f"stats:{d}:users")
-        user_ids |= members
-
-    def s(key_suffix: str) -> int:
-        return sum(counter_map.get(f"stats:{d}:{key_suffix}", 0) for d in dates)
-
-    platform_counts = {p: s(f"success:{p}") for p in platforms}
-    lang_counts = {l: s(f"lang:{l}") for l in langs}
+_MIGRATED_KEY = "stats:migrated"
+# stats:<day>:<counter> and stats:<day>:users, the layout before the day hashes
+_LEGACY_KEY = re.compile(r"stats:\d{4}-\d{2}-\d{2}:(?!uniq$).+")
 
-    return {
-        "requests": s("requests"),
-        "success": sum(platform_counts.values()),
-        "fail": s("fail:youtube") + s("fail:social"),
-        "unique_users": len(user_ids),
-        "private": s("chat:private"),
-        "groups": s("chat:group") + s("chat:supergroup") + s("chat:channel"),
-        "platforms": platform_counts,
-        "langs": lang_counts,
-    }
+# Finished days are folded, once each, into per-week and per-month hashes and
+# HyperLogLogs, and -- on redis-stack -- into one RedisTimeSeries series per
+# counter (a sample per day). None of these expire, so history outlives the
+# daily keys' STATS_TTL and any period is answered from a fixed number of keys.
+# The day named by ROLLUP_MARK_KEY and those before it are folded; later ones
+# (today, and any day the rollup hasn't reached yet) are read from their day
+# hashes. Counters flushed after their day was folded go to the rollups too,
+# see bot.events.handlers.stats.
+_DAY = timedelta(days=1)
+_RETENTION_DAYS = STATS_TTL // (24 * 3600)
 
 
 def _date_range(start: date, end: date) -> list[str]:
@@ -74,11 +51,121 @@ def _date_range(start: date, end: date) -> list[str]:
     return result
 
 
+async def _queue_stats() -> dict[str, dict]:
+    namespace = dramatiq_broker.namespace
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for queue_name in QUEUES:
+            pipe.hlen(f"{namespace}:{queue_name}.msgs")
+            pipe.zcard(f"{namespace}:{queue_name}.XQ")
+        results = await pipe.execute()
+    return {
+        queue_name: {"pending": pending, "failed": failed}
+        for queue_name, pending, failed in zip(QUEUES, results[::2], results[1::2], strict=True)
+    }
+
+
+async def _cache_stats() -> tuple[dict[str, dict[str, int]], str]:
+    usage = await read_usage(redis_client)
+    memory = await redis_client.info("memory")
+    return usage, memory.get("used_memory_human", "?")
+
+
+async def _sum_stats(hash_keys: list[str], hll_keys: list[str] | None, folded: Counter[str] | None = None) -> dict:
+    """
+    Totals of the counter hashes `hash_keys` (day hashes or rollups) plus
+    `folded`, and the unique users across `hll_keys` -- None when those are
+    no longer all kept. One pipeline, whatever the number of users.
+    """
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for key in hash_keys:
+            pipe.hgetall(key)
+        if hll_keys:
+            pipe.pfcount(*hll_keys)
+        results = await pipe.execute()
+
+    unique_users = results.pop() if hll_keys else None
+    totals: Counter[str] = Counter(folded)
+    for counters in results:
+        totals.update({field: int(value) for field, value in counters.items()})
+
+    def prefixed(prefix: str) -> dict[str, int]:
+        return {f.removeprefix(prefix): c for f, c in totals.items() if f.startswith(prefix)}
+
+    platform_counts = prefixed("success:")
+    chats = prefixed("chat:")
+    return {
+        "requests": totals["requests"],
+        "success": sum(platform_counts.values()),
+        "fail": totals["fail:youtube"] + totals["fail:social"],
+        "unique_users": unique_users,
+        "private": chats.get("private", 0),
+        "groups": chats.get("group", 0) + chats.get("supergroup", 0) + chats.get("channel", 0),
+        "platforms": platform_counts,
+        "langs": prefixed("lang:"),
+    }
+
+
+async def _rollup_mark() -> date | None:
+    raw = await redis_client.get(ROLLUP_MARK_KEY)
+    return date.fromisoformat(raw) if raw else None
+
+
+def _unfolded(start: date, end: date, mark: date | None) -> list[str]:
+    """The days of [start, end] the rollup hasn't folded yet."""
+    if mark is not None:
+        start = max(start, mark + _DAY)
+    return _date_range(start, end)
+
+
+async def _bucket_stats(bucket: str, start: date, end: date, mark: date | None) -> dict:
+    """A week or a month: its rollup, plus whatever of it isn't folded in yet."""
+    days = _unfolded(start, end, mark)
+    return await _sum_stats(
+        [bucket, *(stats_key(d) for d in days)],
+        [f"{bucket}:uniq", *(users_key(d) for d in days)],
+    )
+
+
+async def _series_totals(start: date, end: date) -> Counter[str]:
+    """Per-counter sums over the folded days [start, end], in one TS.MRANGE."""
+    if start > end:
+        return Counter()
+    from_ms, to_ms = day_ms(start), day_ms(end)
+    series = await redis_client.ts().mrange(
+        from_ms, to_ms, ["stats=counter"],
+        aggregation_type="sum", bucket_size_msec=to_ms - from_ms + 1, align="-",
+    )
+    totals: Counter[str] = Counter()
+    for entry in series:
+        for key, (_labels, samples) in entry.items():
+            totals[key.removeprefix(series_key(""))] += int(sum(value for _ts, value in samples))
+    return totals
+
+
+async def _days_stats(start: date, end: date, mark: date | None) -> dict:
+    """
+    Any run of days: folded ones from the time series, the rest from their
+    day hashes. Without time series, all of them from their day hashes, so
+    only the days still kept count.
+    """
+    if not await has_timeseries(redis_client):
+        mark = None
+    folded_end = min(end, mark) if mark is not None else start - _DAY
+    folded = await _series_totals(start, folded_end)
+    days = _unfolded(start, end, mark)
+    kept = start > settings.now().date() - timedelta(days=_RETENTION_DAYS)
+    return await _sum_stats(
+        [stats_key(d) for d in days],
+        [users_key(d) for d in _date_range(start, end)] if kept else None,
+        folded,
+    )
+
+
 def _fmt_section(title: str, stats: dict) -> str:
     lines = [
         title,
         f"  Requests:     {stats['requests']}  (✓ {stats['success']}  ✗ {stats['fail']})",
-        f"  Unique users: {stats['unique_users']}",
+        f"  Unique users: {'n/a' if stats['unique_users'] is None else stats['unique_users']}",
         f"  Private: {stats['private']} | Groups: {stats['groups']}",
     ]
     if stats["platforms"]:
@@ -94,16 +181,65 @@ def _fmt_section(title: str, stats: dict) -> str:
     return "\n".join(lines)
 
 
-async def build_stats_report() -> str:
+def _fmt_queues(queue_stats: dict[str, dict]) -> str:
+    lines = ["🔧 Queues"]
+    for queue_name, counts in queue_stats.items():
+        lines.append(f"  {queue_name}: pending {counts['pending']} | failed {counts['failed']}")
+    return "\n".join(lines)
+
+
+def _fmt_cache(usage: dict[str, dict[str, int]], used_memory: str) -> str:
+    lines = [f"💾 Cache (redis total: {used_memory})"]
+    for prefix, counts in usage.items():
+        lines.append(f"  {prefix} {counts['keys']} keys | {counts['bytes'] / 1024 / 1024:.1f}MB")
+    return "\n".join(lines)
+
+
+_RANGE_USAGE = (
+    "Usage: /stats [range], where range is a day (2026-08-14), a week (2026-W33), "
+    "a month (2026-08) or the last N days (30d)"
+)
+
+
+async def _range_report(arg: str, today: date, mark: date | None) -> str:
+    if m := re.fullmatch(r"(\d+)d", arg):
+        n = int(m[1])
+        if n < 1:
+            raise ValueError(arg)
+        start = today - timedelta(days=n - 1)
+        label = f"Last {n} days ({start.strftime('%b %-d, %Y')}–{today.strftime('%b %-d')})"
+        return _fmt_section(label, await _days_stats(start, today, mark))
+    if m := re.fullmatch(r"(\d{4})-W(\d{2})", arg):
+        start = date.fromisocalendar(int(m[1]), int(m[2]), 1)
+        label = f"Week {arg} ({start.strftime('%b %-d')}–{(start + 6 * _DAY).strftime('%b %-d')})"
+        return _fmt_section(label, await _bucket_stats(week_key(start), start, min(start + 6 * _DAY, today), mark))
+    if re.fullmatch(r"\d{4}-\d{2}", arg):
+        start = date.fromisoformat(f"{arg}-01")
+        end = (start + 31 * _DAY).replace(day=1) - _DAY
+        label = start.strftime("%B %Y")
+        return _fmt_section(label, await _bucket_stats(month_key(start), start, min(end, today), mark))
+    day = date.fromisoformat(arg)
+    return _fmt_section(day.strftime("%b %-d, %Y"), await _days_stats(day, day, mark))
+
+
+async def build_stats_report(arg: str | None = None) -> str:
     today = settings.now().date()
+    mark = await _rollup_mark()
+    if arg:
+        try:
+            return await _range_report(arg.strip(), today, mark)
+        except (ValueError, OverflowError):
+            return _RANGE_USAGE
+
     week_start = today - timedelta(days=today.weekday())
     month_start = today.replace(day=1)
 
-    today_stats, week_stats, month_stats, queue_stats = await asyncio.gather(
-        _period_stats([today.strftime("%Y-%m-%d")]),
-        _period_stats(_date_range(week_start, today)),
-        _period_stats(_date_range(month_start, today)),
+    today_stats, week_stats, month_stats, queue_stats, (cache_usage, used_memory) = await asyncio.gather(
+        _days_stats(today, today, mark),
+        _bucket_stats(week_key(today), week_start, today, mark),
+        _bucket_stats(month_key(today), month_start, today, mark),
         _queue_stats(),
+        _cache_stats(),
     )
 
     today_label = f"Today ({today.strftime('%b %-d')})"
@@ -119,5 +255,135 @@ async def build_stats_report() -> str:
         "",
         _fmt_section(month_label, month_stats),
         "",
-        f"🔧 Queue: pending {queue_stats['pending']} | failed {queue_stats['failed']}",
+        _fmt_queues(queue_stats),
+        "",
+        _fmt_cache(cache_usage, used_memory),
     ])
+
+
+async def migrate_legacy_stats() -> None:
+    """
+    One-off move of the old layout -- a string key per counter per day and a
+    set of user ids per day -- into the day hashes and HyperLogLogs. Uses
+    SCAN, never KEYS, and deletes each old key in the same transaction that
+    folds it in.
+    """
+    if await redis_client.exists(_MIGRATED_KEY):
+        return
+    moved = 0
+    cursor = 0
+    while True:
+        cursor, keys = await redis_client.scan(cursor, match="stats:*:*", count=1000)
+        keys = [k for k in keys if _LEGACY_KEY.fullmatch(k)]
+        if keys:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    if key.endswith(":users"):
+                        pipe.smembers(key)
+                    else:
+                        pipe.get(key)
+                values = await pipe.execute()
+
+            async with redis_client.pipeline(transaction=True) as pipe:
+                for key, value in zip(keys, values, strict=True):
+                    _, day, field = key.split(":", 2)
+                    if field == "users":
+                        if value:
+                            pipe.pfadd(users_key(day), *value)
+                            pipe.expire(users_key(day), STATS_TTL)
+                    elif value:
+                        pipe.hincrby(stats_key(day), field, int(value))
+                        pipe.expire(stats_key(day), STATS_TTL)
+                    pipe.delete(key)
+                await pipe.execute()
+            moved += len(keys)
+        if cursor == 0:
+            break
+    await redis_client.set(_MIGRATED_KEY, 1)
+    log.info("moved %d legacy stats keys to the per-day hashes", moved)
+
+
+async def _fold_day(d: date) -> None:
+    day = d.strftime("%Y-%m-%d")
+    ms = day_ms(d)
+    timeseries = await has_timeseries(redis_client)
+    async with redis_client.pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                # a flush landing between the read and the EXEC (see
+                # _write_late) makes the fold start over, with its counts in
+                await pipe.watch(stats_key(day), users_key(day), ROLLUP_MARK_KEY)
+                mark = await pipe.get(ROLLUP_MARK_KEY)
+                if mark and mark >= day:
+                    return
+                counters = await pipe.hgetall(stats_key(day))
+                unique_users = await pipe.pfcount(users_key(day))
+
+                # one transaction with the mark, so a day is never folded twice
+                pipe.multi()
+                for bucket in (week_key(d), month_key(d)):
+                    for field, value in counters.items():
+                        pipe.hincrby(bucket, field, int(value))
+                    pipe.pfmerge(f"{bucket}:uniq", f"{bucket}:uniq", users_key(day))
+                if timeseries:
+                    ts = pipe.ts()
+                    for field, value in counters.items():
+                        ts.add(series_key(field), ms, int(value), labels={"stats": "counter"}, on_duplicate="last")
+                    # daily uniques, for graphing; not summable, so not labelled as a counter
+                    ts.add(series_key("users"), ms, unique_users, labels={"stats": "users"}, on_duplicate="last")
+                pipe.set(ROLLUP_MARK_KEY, day)
+                await pipe.execute()
+                return
+            except WatchError:
+                continue
+
+
+async def rollup_stats() -> int:
+    """
+    Folds every finished day not folded yet into the weekly and monthly
+    rollups and the time series; the first run backfills the days still kept.
+    Returns the number of days folded.
+    """
+    yesterday = settings.now().date() - _DAY
+    mark = await _rollup_mark()
+    d = mark + _DAY if mark else yesterday - timedelta(days=_RETENTION_DAYS - 1)
+    folded = 0
+    while d <= yesterday:
+        await _fold_day(d)
+        d += _DAY
+        folded += 1
+    if folded:
+        log.info("folded %d days of stats into the rollups", folded)
+    return folded
+
+
+async def _maintain_rollups() -> None:
+    while True:
+        try:
+            await rollup_stats()
+        except RedisError as e:
+            log.warning("stats rollup failed: %r", e)
+        await asyncio.sleep(settings.stats_rollup_interval)
+
+
+_background: list[asyncio.Task] = []
+
+
+@dp.startup()
+async def on_startup(*args: object, **kwargs: object) -> None:
+    try:
+        await migrate_legacy_stats()
+    except RedisError:
+        log.exception("failed to migrate legacy stats keys, will retry on next start")
+    else:
+        # folding needs the migrated layout, so only once the migration is done
+        _background.append(asyncio.create_task(_maintain_rollups()))
+
+
+@dp.shutdown()
+async def on_shutdown(*args: object, **kwargs: object) -> None:
+    for task in _background:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    _background.clear()
@@ -0,0 +1,31 @@
+from pathlib import Path
+from typing import Any
+
+from aiogram import Bot, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from bot.config import settings
+from bot.util.rate_limit import TelegramRateLimiter
+
+
+def create_bot(token: str, rate_limited: bool = True, **kwargs: Any) -> Bot:
+    """Every Bot the bot/worker processes talk to Telegram through -- never
+    construct one directly, or its requests bypass the shared rate limiter and
+    the local Bot API server, if one is configured. `rate_limited=False` only
+    for a Bot running on a loop without a Redis client of its own."""
+    if settings.telegram_api_url:
+        api = TelegramAPIServer.from_base(settings.telegram_api_url, is_local=settings.telegram_api_local)
+        kwargs.setdefault("session", AiohttpSession(api=api))
+    bot = Bot(token, **kwargs)
+    if rate_limited:
+        bot.session.middleware(TelegramRateLimiter())
+    return bot
+
+
+def input_file(file_path: Path) -> types.InputFile | str:
+    """A local file to upload: a file:// path a local Bot API server reads off
+    disk itself, or a multipart upload streamed from disk otherwise."""
+    if settings.telegram_api_url and settings.telegram_api_local:
+        return file_path.resolve().as_uri()
+    return types.FSInputFile(file_path)
@@ -2,21 +2,48 @@ import asyncio
 import html
 import logging
 import queue
+import sys
 import threading
+import time
 import traceback
+from dataclasses import dataclass
 
 from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
 from aiogram.types import LinkPreviewOptions
 
 from bot.config import settings
+from bot.util.telegram import create_bot
 
 _MAX_MESSAGE_LEN = 4000  # keep under Telegram's 4096-char message cap with margin
+# room kept in every alert for the "N more alerts dropped" note appended on send
+_MAX_ALERT_LEN = _MAX_MESSAGE_LEN - 80
 
 # loggers whose records we never forward: the send path itself goes through
 # aiogram/aiohttp, so forwarding those risks a send-triggers-send feedback loop
 _EXCLUDED_LOGGERS = ("aiogram", "aiohttp", "asyncio")
 
 
+def _escape(text: str, limit: int) -> str:
+    """`text` HTML-escaped and cut to at most `limit` characters, never inside an entity."""
+    escaped = html.escape(text)
+    if len(escaped) <= limit:
+        return escaped
+    cut = escaped[:limit - 1]
+    if cut.rfind("&") > cut.rfind(";"):
+        cut = cut[:cut.rfind("&")]
+    return cut + "…"
+
+
+@dataclass
+class _Window:
+    """An alert fingerprint's coalescing window: when it opened and what it swallowed since."""
+
+    opened_at: float
+    summary: str = ""  # the first alert's header and message line, to head the "×N" follow-up
+    repeats: int = 0
+
+
 class TelegramAlertHandler(logging.Handler):
     """Forwards log records at/above its level to a Telegram chat, one message
     per record -- never split across multiple messages.
@@ -31,22 +58,60 @@ class TelegramAlertHandler(logging.Handler):
     traceback string recovered from a dramatiq message) -- is appended as a
     monospace block only if it still fits in one message, and dropped entirely
     otherwise rather than shipping a second message for the overflow.
+
+    During an incident the same alert tends to fire on every job. Records are
+    fingerprinted (logger, call site, unformatted message, exception type):
+    the first of a fingerprint is sent, repeats within `coalesce_window`
+    seconds are only counted, and one "×N in the last 5 min" message follows
+    when the window closes. The queue is bounded too; alerts that don't fit
+    are counted in `dropped` and reported with the next message that goes out.
     """
 
-    def __init__(self, token: str, chat_id: int, level: int = logging.CRITICAL) -> None:
+    def __init__(
+        self,
+        token: str,
+        chat_id: int,
+        level: int = logging.CRITICAL,
+        coalesce_window: float = 5 * 60,
+        max_queue: int = 100,
+    ) -> None:
         super().__init__(level)
         self._token = token
         self._chat_id = chat_id
-        self._queue: queue.Queue[str] = queue.Queue()
+        self._coalesce_window = coalesce_window
+        self._queue: queue.Queue[str] = queue.Queue(maxsize=max_queue)
+        self._windows: dict[tuple, _Window] = {}
+        self._windows_lock = threading.Lock()
+        self.dropped = 0  # alerts lost to a full queue, ever
+        self._dropped_unreported = 0
         self._thread = threading.Thread(target=self._run, name="telegram-alert-handler", daemon=True)
         self._thread.start()
 
+    @staticmethod
+    def _fingerprint(record: logging.LogRecord) -> tuple:
+        if record.exc_info and record.exc_info[0]:
+            exc_type = record.exc_info[0].__name__
+        else:
+            # a traceback string's last line reads "module.ErrorType: message"
+            pre_text = (getattr(record, "pre_text", None) or "").strip()
+            exc_type = pre_text.rpartition("\n")[2].partition(":")[0] or None
+        return record.name, record.pathname, record.lineno, str(record.msg), exc_type
+
     def emit(self, record: logging.LogRecord) -> None:
         if any(record.name == n or record.name.startswith(n + ".") for n in _EXCLUDED_LOGGERS):
             return
+        fingerprint = self._fingerprint(record)
+        with self._windows_lock:
+            window = self._windows.get(fingerprint)
+            if window is not None:
+                window.repeats += 1
+                return
+            window = self._windows[fingerprint] = _Window(time.monotonic())
         try:
             header = f"🚨 <b>{html.escape(record.levelname)} — {html.escape(record.name)}</b>"
-            text = f"{header}\n{html.escape(record.getMessage())}"
+            message = record.getMessage()
+            text = f"{header}\n{_escape(message, _MAX_ALERT_LEN - len(header) - 1)}"
+            window.summary = f"{header}\n{html.escape(message.partition(chr(10))[0][:500])}"
 
             tb_parts = []
             if record.exc_info:
@@ -55,31 +120,75 @@ class TelegramAlertHandler(logging.Handler):
                 tb_parts.append(pre_text)
             if tb_parts:
                 tb_block = f"\n<pre>{html.escape(chr(10).join(tb_parts))}</pre>"
-                if len(text) + len(tb_block) <= _MAX_MESSAGE_LEN:
+                if len(text) + len(tb_block) <= _MAX_ALERT_LEN:
                     text += tb_block
         except Exception:
+            self.handleError(record)
             return
-        self._queue.put_nowait(text[:_MAX_MESSAGE_LEN])
+        try:
+            self._queue.put_nowait(text)
+        except queue.Full:
+            with self._windows_lock:
+                self.dropped += 1
+                self._dropped_unreported += 1
+
+    def _closed_windows(self) -> tuple[list[str], float | None]:
+        """Follow-ups for the windows that closed, and the seconds until the next one closes."""
+        now = time.monotonic()
+        follow_ups, next_close = [], None
+        with self._windows_lock:
+            for fingerprint, window in list(self._windows.items()):
+                closes_at = window.opened_at + self._coalesce_window
+                if closes_at > now:
+                    next_close = min(next_close or closes_at, closes_at)
+                    continue
+                del self._windows[fingerprint]
+                if window.repeats:
+                    minutes = max(1, round(self._coalesce_window / 60))
+                    follow_ups.append(f"🔁 <b>×{window.repeats}</b> in the last {minutes} min\n{window.summary}")
+        return follow_ups, None if next_close is None else next_close - now
+
+    def _take_drop_note(self) -> str:
+        with self._windows_lock:
+            dropped, self._dropped_unreported = self._dropped_unreported, 0
+        return f"\n\n⚠️ {dropped} more alerts dropped, the alert queue was full" if dropped else ""
 
     def _run(self) -> None:
+        # one loop and one Bot (so one aiohttp session) for the thread's whole
+        # life, instead of a fresh loop, Bot and TLS handshake per alert. No
+        # rate limiter: it talks to Redis through a client bound to the main
+        # loop, not this one.
+        loop = asyncio.new_event_loop()
+        bot = create_bot(self._token, rate_limited=False)
+        timeout = None
         while True:
-            text = self._queue.get()
             try:
-                asyncio.run(self._send(text))
-            except Exception:
-                pass
-
-    async def _send(self, text: str) -> None:
-        bot = Bot(token=self._token)
-        try:
-            await bot.send_message(
-                self._chat_id,
-                text,
-                parse_mode="HTML",
-                link_preview_options=LinkPreviewOptions(is_disabled=True),
-            )
-        finally:
-            await bot.session.close()
+                texts = [self._queue.get(timeout=timeout)]
+            except queue.Empty:
+                texts = []
+            follow_ups, timeout = self._closed_windows()
+            for text in [*texts, *follow_ups]:
+                try:
+                    loop.run_until_complete(self._send(bot, text + self._take_drop_note()))
+                except Exception:
+                    # not through logging: a failed alert would only queue another
+                    print("telegram alert handler: could not send an alert", file=sys.stderr)
+                    traceback.print_exc()
+
+    async def _send(self, bot: Bot, text: str) -> None:
+        for attempt in range(2):
+            try:
+                await bot.send_message(
+                    self._chat_id,
+                    text,
+                    parse_mode="HTML",
+                    link_preview_options=LinkPreviewOptions(is_disabled=True),
+                )
+                return
+            except TelegramRetryAfter as e:
+                if attempt:
+                    raise
+                await asyncio.sleep(e.retry_after)
 
 
 def install_admin_alert_handler() -> None:
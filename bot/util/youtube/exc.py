@@ -1,7 +1,6 @@
+import sys
 from collections.abc import Callable
-from functools import wraps
-
-from pytubefix import exceptions as pytubefix_exc
+from functools import cache, wraps
 
 
 class YouTubeError(Exception):
@@ -20,25 +19,34 @@ class YouTubeError(Exception):
 #
 # The reason text is user-visible verbatim -- actors.py renders it as
 # "Couldn't process this video: {e}" -- so keep it a plain clause.
-_PERMANENT_REASONS: tuple[tuple[type[Exception], str], ...] = (
-    (pytubefix_exc.LoginRequired, "YouTube requires signing in to view it"),
-    (pytubefix_exc.MembersOnly, "it's for channel members only"),
-    (pytubefix_exc.VideoPrivate, "it's private"),
-    (pytubefix_exc.AgeRestrictedError, "it's age-restricted"),
-    (pytubefix_exc.AgeCheckRequiredError, "it needs an age check"),
-    (pytubefix_exc.AgeCheckRequiredAccountError, "it needs an age-verified account"),
-    (pytubefix_exc.VideoRemovedByUploader, "the uploader removed it"),
-    (pytubefix_exc.VideoRemovedByYouTubeForViolatingTOS, "YouTube removed it"),
-    (pytubefix_exc.VideoBlockedByCopyright, "it's blocked on copyright grounds"),
-    (pytubefix_exc.AccountTerminated, "the uploader's account was terminated"),
-    (pytubefix_exc.RecordingUnavailable, "the recording isn't available"),
-    (pytubefix_exc.LiveStreamError, "it's a live stream"),
-    (pytubefix_exc.LiveStreamOffline, "the live stream is offline"),
-    (pytubefix_exc.LiveStreamEnded, "the live stream has ended"),
-)
+@cache
+def _permanent_reasons() -> tuple[tuple[type[Exception], str], ...]:
+    from pytubefix import exceptions as pytubefix_exc
+
+    return (
+        (pytubefix_exc.LoginRequired, "YouTube requires signing in to view it"),
+        (pytubefix_exc.MembersOnly, "it's for channel members only"),
+        (pytubefix_exc.VideoPrivate, "it's private"),
+        (pytubefix_exc.AgeRestrictedError, "it's age-restricted"),
+        (pytubefix_exc.AgeCheckRequiredError, "it needs an age check"),
+        (pytubefix_exc.AgeCheckRequiredAccountError, "it needs an age-verified account"),
+        (pytubefix_exc.VideoRemovedByUploader, "the uploader removed it"),
+        (pytubefix_exc.VideoRemovedByYouTubeForViolatingTOS, "YouTube removed it"),
+        (pytubefix_exc.VideoBlockedByCopyright, "it's blocked on copyright grounds"),
+        (pytubefix_exc.AccountTerminated, "the uploader's account was terminated"),
+        (pytubefix_exc.RecordingUnavailable, "the recording isn't available"),
+        (pytubefix_exc.LiveStreamError, "it's a live stream"),
+        (pytubefix_exc.LiveStreamOffline, "the live stream is offline"),
+        (pytubefix_exc.LiveStreamEnded, "the live stream has ended"),
+    )
+
 
 def _permanent_reason(exc: BaseException) -> str | None:
-    for cls, reason in _PERMANENT_REASONS:
+    # whatever raised one of pytubefix's exceptions has imported it: don't
+    # import it here just to find out that this isn't one
+    if "pytubefix" not in sys.modules:
+        return None
+    for cls, reason in _permanent_reasons():
         if isinstance(exc, cls):
             return reason
     return None
@@ -59,7 +67,7 @@ def translates_youtube_errors[**P, R](fn: Callable[P, R]) -> Callable[P, R]:
             return fn(*args, **kwargs)
         except YouTubeError:
             raise
-        except pytubefix_exc.PytubeFixError as e:
+        except Exception as e:
             reason = _permanent_reason(e)
             if reason is None:
                 raise
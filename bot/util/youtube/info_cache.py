@@ -0,0 +1,111 @@
+"""
+Innertube player responses (with the client and PO token that fetched them)
+shared through Redis for settings.youtube_info_ttl seconds, so the jobs
+touching a video ask YouTube once. Best-effort, and only playable responses
+are kept. pytubefix is imported on the first cached_youtube() call.
+"""
+import json
+import logging
+import re
+from functools import cache
+from typing import TYPE_CHECKING
+
+import zstandard
+from redis.exceptions import RedisError
+
+from bot.config import settings
+from bot.util.redis import sync_redis_client
+
+if TYPE_CHECKING:
+    from pytubefix import YouTube
+
+log = logging.getLogger(__name__)
+
+# pytubefix.extract.video_id's pattern, which YouTube() reads video_id with
+_VIDEO_ID = re.compile(r"(?:v=|/)([0-9A-Za-z_-]{11}).*")
+
+
+def video_id(url: str) -> str:
+    """The id of a YouTube video link, same as pytubefix's `YouTube(url).video_id`."""
+    if m := _VIDEO_ID.search(url):
+        return m[1]
+    raise ValueError(f"no video id in {url!r}")
+
+
+def info_key(video_id: str) -> str:
+    # not "yt:" -- that prefix is the processed-video cache, see bot.util.cache
+    return f"ytinfo:{video_id}"
+
+
+def forget_info(video_id: str) -> None:
+    """Drops the shared response, e.g. when its stream URLs stopped working."""
+    try:
+        sync_redis_client.delete(info_key(video_id))
+    except RedisError as e:
+        log.warning("could not drop cached player response of %s: %r", video_id, e)
+
+
+def cached_youtube(url: str) -> "YouTube":
+    """A pytubefix YouTube for `url` that takes its player response from Redis when it's there."""
+    return _cached_youtube_class()(url)
+
+
+@cache
+def _cached_youtube_class() -> type["YouTube"]:
+    from pytubefix import YouTube
+
+    return type("CachedYouTube", (_SharedInfo, YouTube), {})
+
+
+class _SharedInfo:
+    """Mixed into pytubefix's YouTube, ahead of it: its vid_info goes through the cache."""
+
+    _info_checked = False
+
+    @property
+    def vid_info(self) -> dict:
+        if self._vid_info:
+            return self._vid_info
+
+        # only the first lookup may come from the cache: a later one is
+        # pytubefix retrying with its fallback clients, which must go out
+        if not self._info_checked:
+            self._info_checked = True
+            if self._load_info():
+                return self._vid_info
+
+        self._vid_info = self.vid_info_client()
+        self._store_info()
+        return self._vid_info
+
+    @vid_info.setter
+    def vid_info(self, value: dict) -> None:
+        self._vid_info = value
+
+    def _load_info(self) -> bool:
+        if not settings.youtube_info_ttl:
+            return False
+        try:
+            raw = sync_redis_client.get(info_key(self.video_id))
+        except RedisError as e:
+            log.warning("could not read cached player response of %s: %r", self.video_id, e)
+            return False
+        if raw is None:
+            return False
+        entry = json.loads(zstandard.decompress(raw))
+        self.client, self.po_token, self._vid_info = entry["client"], entry["po_token"], entry["vid_info"]
+        log.debug("player response of %s rehydrated from cache (%s client)", self.video_id, self.client)
+        return True
+
+    def _store_info(self) -> None:
+        if not settings.youtube_info_ttl or "streamingData" not in (self._vid_info or {}):
+            return
+        entry = {"client": self.client, "po_token": self.po_token, "vid_info": self._vid_info}
+        try:
+            sync_redis_client.set(
+                info_key(self.video_id),
+                zstandard.compress(json.dumps(entry).encode(), 3),
+                ex=settings.youtube_info_ttl,
+            )
+        except RedisError as e:
+            log.warning("could not cache player response of %s: %r", self.video_id, e)
@@ -3,10 +3,10 @@ from functools import cached_property
 
 from aiogram import Bot, types
 from pydantic import BaseModel, Field
-from pytubefix import YouTube
 
 from .enum import SourceLang, TargetLang
 from .exc import translates_youtube_errors
+from .info_cache import cached_youtube, forget_info, video_id
 
 log = logging.getLogger(__name__)
 
@@ -48,7 +48,13 @@ class YouTubeVideoData(BaseModel):
     def yt(self):
         # https://github.com/JuanBindez/pytubefix/pull/209
         # return YouTube(self.link, "WEB")
-        return YouTube(self.link)
+        return cached_youtube(self.link)
+
+    def refresh_yt(self) -> None:
+        """Forgets `yt` and its shared player response, so the next access asks YouTube afresh."""
+        if "yt" in self.__dict__:
+            forget_info(video_id(self.link))
+            del self.__dict__["yt"]
 
     @translates_youtube_errors
     def capture_metadata(self) -> None:
@@ -89,7 +95,8 @@ class YouTubeVideoData(BaseModel):
 
     @property
     def cache_key(self):
-        return f"yt:{self.yt.video_id}"
+        # not self.yt.video_id: that would import pytubefix into the bot process
+        return f"yt:{video_id(self.link)}"
 
     @property
     def caption(self):
@@ -126,7 +133,7 @@ class YouTubeVideoData(BaseModel):
     def audio_button_markup(self) -> types.InlineKeyboardMarkup:
         return types.InlineKeyboardMarkup(
             inline_keyboard=[[
-                types.InlineKeyboardButton(text="🎵 Get audio", callback_data=f"aud:{self.yt.video_id}")
+                types.InlineKeyboardButton(text="🎵 Get audio", callback_data=f"aud:{video_id(self.link)}")
             ]]
         )
 
@@ -2,24 +2,17 @@ import logging
 import subprocess
 from pathlib import Path
 
-from faster_whisper import WhisperModel
-from pydub import AudioSegment
 from pytubefix import YouTube
 
+from bot.util.concurrency import cpu_slot
+from bot.util.process import run_process
+
 from .enum import SourceLang
 from .schema import YouTubeVideoData
+from .whisper import whisper
 
 log = logging.getLogger(__name__)
 
-_whisper_model: WhisperModel | None = None
-
-
-def _get_whisper_model() -> WhisperModel:
-    global _whisper_model
-    if _whisper_model is None:
-        _whisper_model = WhisperModel("tiny", device="cpu")
-    return _whisper_model
-
 
 def maybe_translate_audio(
     video: YouTubeVideoData,
@@ -44,7 +37,7 @@ def maybe_translate_audio(
     video.translated_lang = video.target_lang
     result_audio_path = (
         Path(output_dir)
-        / f"{video.yt.video_id}.translated.{video.target_lang}.mixed.mp3"
+        / f"{video.yt.video_id}.translated.{video.target_lang}.mixed.m4a"
     )
 
     # mix original and translated audios
@@ -55,12 +48,10 @@ def maybe_translate_audio(
 
 
 def detect_source_lang(audio_path: str) -> SourceLang | None:
-    model = _get_whisper_model()
-
-    # Transcribe just to get language info (no need to iterate over segments)
-    _, info = model.transcribe(audio_path, beam_size=5)
-
-    code, prob = info.language, info.language_probability
+    detected = whisper.detect_language(audio_path)
+    if detected is None:
+        return None
+    code, prob = detected
 
     if prob < 0.1:
         # Very low confidence, likely music
@@ -87,15 +78,9 @@ def translate_audio(yt: YouTube, output_dir: str, target_lang: str) -> Path | No
     ]
     try:
         # set a hard limit for a command (in case it hangs for some reason)
-        subprocess.run(
-            command,
-            check=True,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-            timeout=120,
-        )
-    except subprocess.CalledProcessError:
-        log.info("failed to translate %s to %s", yt.video_id, target_lang)
+        run_process(command, timeout=120)
+    except subprocess.CalledProcessError as e:
+        log.info("failed to translate %s to %s: %s", yt.video_id, target_lang, e)
         return None
     except subprocess.TimeoutExpired:
         log.info("failed to translate %s to %s (timeout)", yt.video_id, target_lang)
@@ -128,10 +113,14 @@ def mix_audio(
     :param output_path: Path to save the output mixed audio.
     :param original_volume_db: Volume reduction for the original audio (in dB). Default is -10 dB.
     """
+    # imported here: pydub is only needed for translated videos
+    from pydub import AudioSegment
+
     log.info("mixing %s and %s", original_audio_path, translated_audio_path)
 
-    original_audio = AudioSegment.from_file(original_audio_path)
-    translated_audio = AudioSegment.from_file(translated_audio_path)
+    with cpu_slot():
+        original_audio = AudioSegment.from_file(original_audio_path)
+        translated_audio = AudioSegment.from_file(translated_audio_path)
 
     original_audio = original_audio + original_volume_db
 
@@ -146,4 +135,6 @@ def mix_audio(
         )
 
     mixed_audio = original_audio.overlay(translated_audio)
-    mixed_audio.export(output_path, format="mp3")
+    with cpu_slot():
+        # AAC in mp4, like YouTube's own audio streams: the merge then copies it as-is
+        mixed_audio.export(output_path, format="ipod", codec="aac", bitrate="128k")
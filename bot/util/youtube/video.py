@@ -1,27 +1,45 @@
+import contextvars
 import logging
 import math
-import subprocess
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from pathlib import Path
 
 import ffmpeg
 from pytubefix import Stream
 
 from bot.config import settings
+from bot.util.concurrency import cpu_slot, cpu_slots
+from bot.util.process import log_progress, run_ffmpeg
 
 from .enum import TargetLang
 from .exc import YouTubeError, translates_youtube_errors
 from .schema import YouTubeVideoData
 from .translate import maybe_translate_audio
 
-MAX_FILE_SIZE_BYTES = 50 * 1024 * 1024  # 50MB
+# the cloud Bot API caps uploads at 50MB; a self-hosted server lifts that to
+# 2000MB only in --local mode (TELEGRAM_API_LOCAL)
+MAX_FILE_SIZE_BYTES = (2000 if settings.telegram_api_url and settings.telegram_api_local else 50) * 1024 * 1024
+
+# ffmpeg deadlines: a stream copy is bound by disk speed, an encode by the
+# video's length -- one that runs slower than real time has stalled
+_REMUX_TIMEOUT = 10 * 60
+
+
+def _encode_timeout(duration_seconds: int | None) -> int:
+    return _REMUX_TIMEOUT + (duration_seconds or 0)
 
 
 log = logging.getLogger(__name__)
 
 
-def get_resolution(stream: Stream) -> tuple[int, int]:
+def get_resolution(stream: Stream, file_path: Path | None = None) -> tuple[int, int]:
+    """The stream's real dimensions; probes `file_path`, if it's already downloaded, instead of the network."""
     try:
-        probe = ffmpeg.probe(stream.url, v='error', select_streams='v:0', show_entries='stream=width,height')
+        source = str(file_path) if file_path else stream.url
+        probe = ffmpeg.probe(source, v='error', select_streams='v:0', show_entries='stream=width,height')
         width = probe['streams'][0]['width']
         height = probe['streams'][0]['height']
         log.info("probed resolution %dx%d for %s", width, height, stream)
@@ -40,8 +58,19 @@ def get_resolution(stream: Stream) -> tuple[int, int]:
     return 720, 480
 
 
+def get_audio_codec(audio_path: Path | str) -> str | None:
+    """The codec of the file's first audio stream (e.g. "aac"), None if it can't be probed."""
+    try:
+        probe = ffmpeg.probe(str(audio_path), v='error', select_streams='a:0', show_entries='stream=codec_name')
+        return probe['streams'][0]['codec_name']
+    except (ffmpeg.Error, KeyError, IndexError) as e:
+        log.warning("ffmpeg probe of %s failed, will re-encode its audio: %s", audio_path, e)
+        return None
+
+
 @translates_youtube_errors
-def get_audio_stream(video: YouTubeVideoData, output_path: Path):
+def download_audio_stream(video: YouTubeVideoData, output_path: Path) -> str:
+    """Downloads the best mp4 audio stream, as is (never translated)."""
     audio_streams = video.yt.streams.filter(file_extension='mp4', only_audio=True).order_by('abr').desc()
     log.info('adaptive audio streams: %s', audio_streams)
     audio_stream = audio_streams.first()
@@ -50,8 +79,10 @@ def get_audio_stream(video: YouTubeVideoData, output_path: Path):
         raise YouTubeError('no adaptive audio stream found')
 
     log.info('downloading audio stream')
-    audio_stream_path = audio_stream.download(output_path=str(output_path), filename=f'{video.yt.video_id}.audio.mp4')
+    return audio_stream.download(output_path=str(output_path), filename=f'{video.yt.video_id}.audio.mp4')
 
+
+def _maybe_translate(video: YouTubeVideoData, output_path: Path, audio_stream_path: str) -> str:
     if settings.enable_audio_translation and video.target_lang != TargetLang.ORIGINAL:
         log.info('trying to translate audio stream to %s', video.target_lang)
         translated_audio_path = maybe_translate_audio(video, str(output_path), audio_stream_path)
@@ -62,15 +93,41 @@ def get_audio_stream(video: YouTubeVideoData, output_path: Path):
     return audio_stream_path
 
 
+@translates_youtube_errors
+def get_audio_stream(video: YouTubeVideoData, output_path: Path):
+    return _maybe_translate(video, output_path, download_audio_stream(video, output_path))
+
+
 def pick_stream(
-    video: YouTubeVideoData, output_path: Path, min_res: int, max_res: int = settings.max_video_resolution
-) -> tuple[Stream, int, Path]:
+    video: YouTubeVideoData,
+    output_path: Path,
+    min_res: int,
+    max_res: int = settings.max_video_resolution,
+    itag: int | None = None,
+    min_parts: int = 1,
+) -> tuple[Stream, int, Path, Path]:
+    """
+    Returns the stream picked, its part count, the merged file, and the
+    original audio track -- not the translation merged in its place, if any.
+    """
     # select a stream that can be split into as few parts as possible
     # We always want the highest audio quality
-    audio_stream_path = get_audio_stream(video, output_path)
+    original_audio_path = download_audio_stream(video, output_path)
+    audio_stream_path = _maybe_translate(video, output_path, original_audio_path)
     audio_size = Path(audio_stream_path).stat().st_size
+    # YouTube's mp4 audio (and the translated mix) is AAC already: copy it
+    # instead of re-encoding, so a merge within the resolution cap is a remux
+    audio_codec_args = ['-c:a', 'copy'] if get_audio_codec(audio_stream_path) == 'aac' else ['-c:a', 'aac']
 
     video_streams = video.yt.streams.filter(file_extension='mp4', subtype='mp4', only_video=True).order_by('resolution').desc()
+    if itag is not None:
+        # resuming: an earlier attempt already picked this one, skip probing the rest
+        picked = [s for s in video_streams if s.itag == itag]
+        if picked:
+            video_streams = picked
+        else:
+            log.info('previously picked stream %s is gone, picking again', itag)
+            min_parts = 1
     # filter only supported streams
     video_streams = [
         s for s in video_streams if
@@ -104,7 +161,7 @@ def pick_stream(
     video_streams = tier1 or tier2
     log.info('supported adaptive video streams: %s', video_streams)
 
-    for n_parts in range(1, 11):  # 10 max (what an album can fit)
+    for n_parts in range(min_parts, 11):  # 10 max (what an album can fit)
         for stream in video_streams:
             stream: Stream
             total_size = audio_size + stream.filesize
@@ -138,22 +195,30 @@ def pick_stream(
                 real_height = stream_heights[stream]
                 if real_height <= max_res:
                     video_codec_args = ['-c:v', 'copy']  # Copy video codec without re-encoding
+                elif settings.worker_cpu_slots > 1 and video.yt.length >= settings.encode_chunked_min_seconds:
+                    video_stream_path = encode_chunked(video_stream_path, output_path, max_res, video.yt.length)
+                    video_codec_args = ['-c:v', 'copy']
                 else:
                     video_codec_args = ['-vf', f'scale=-2:{max_res}', '-c:v', 'libx264']
                 command = [
-                    'ffmpeg',
-                    '-y',  # Overwrite an output file if exists
                     '-i', str(video_stream_path),
                     '-i', audio_stream_path,
                     '-map', '0:v:0',  # Take video from the first input
                     '-map', '1:a:0',  # Take audio from the second input
                     *video_codec_args,
-                    '-c:a', 'aac',    # Ensure audio is in the proper format
-                    # '-b:a', '192k',  # Optional: control audio quality
+                    *audio_codec_args,
                     '-movflags', '+faststart',
                     str(merged_stream_path)
                 ]
-                subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                # a pure remux is disk I/O, it needn't wait for (or hold) a CPU slot
+                remux = video_codec_args[-1] == 'copy' and audio_codec_args[-1] == 'copy'
+                with nullcontext() if remux else cpu_slot():
+                    run_ffmpeg(
+                        command,
+                        timeout=_REMUX_TIMEOUT if remux else _encode_timeout(video.yt.length),
+                        duration=video.yt.length,
+                        on_progress=log_progress(f'merging {merged_stream_filename}'),
+                    )
 
             merged_size = merged_stream_path.stat().st_size
             log.info("%s merged size: %.3fMb", merged_stream_path, merged_size / 1024 / 1024)
@@ -164,11 +229,61 @@ def pick_stream(
                 continue
 
             log.info('selected stream (%d parts, %dMb merged size): %s', n_parts, merged_size // 1024 // 1024, stream)
-            return stream, n_parts, merged_stream_path
+            return stream, n_parts, merged_stream_path, Path(original_audio_path)
 
     raise YouTubeError(f'no suitable video stream found for {video.yt.length}s video length')
 
 
+def encode_chunked(video_path: Path, output_dir: Path, height: int, duration_seconds: int) -> Path:
+    """
+    Downscales a video-only stream to `height` with libx264, in parallel: the
+    source is cut at keyframes into chunks (stream copy), the chunks are
+    encoded concurrently -- one ffmpeg each, as many at a time as CPU slots
+    are free -- and concat-demuxed back into one stream.
+    """
+    chunk_dir = output_dir / f'{video_path.stem}.chunks'
+    chunk_dir.mkdir(exist_ok=True)
+    try:
+        with cpu_slots(settings.worker_cpu_slots) as workers:
+            # more chunks than workers, so one slow chunk doesn't leave the rest idle
+            segment_time = max(10, math.ceil(duration_seconds / (workers * 2)))
+            run_ffmpeg([
+                '-i', str(video_path), '-map', '0:v:0', '-c', 'copy',
+                '-f', 'segment', '-segment_time', str(segment_time), '-reset_timestamps', '1',
+                str(chunk_dir / 'src_%03d.mp4'),
+            ], timeout=_REMUX_TIMEOUT)
+            sources = sorted(chunk_dir.glob('src_*.mp4'))
+            # split the cores between the encoders instead of each assuming it has them all
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            log.info('encoding %d chunks of %ds on %d slots', len(sources), segment_time, workers)
+
+            def encode(source: Path) -> Path:
+                target = source.with_name(source.name.replace('src_', 'enc_'))
+                run_ffmpeg([
+                    '-i', str(source), '-vf', f'scale=-2:{height}',
+                    '-c:v', 'libx264', '-threads', str(threads), str(target),
+                ], timeout=_encode_timeout(segment_time))
+                return target
+
+            with ThreadPoolExecutor(workers, thread_name_prefix='encode-chunk') as pool:
+                # each encode in a copy of this context: run_ffmpeg reads the
+                # job's cancel event from a contextvar, and pool threads start
+                # with an empty context
+                futures = [pool.submit(contextvars.copy_context().run, encode, source) for source in sources]
+                encoded = [future.result() for future in futures]
+
+        concat_list = chunk_dir / 'chunks.txt'
+        concat_list.write_text(''.join(f"file '{path.name}'\n" for path in encoded))
+        output = output_dir / f'{video_path.stem}.{height}p.mp4'
+        run_ffmpeg(
+            ['-f', 'concat', '-safe', '0', '-i', str(concat_list), '-c', 'copy', str(output)],
+            timeout=_REMUX_TIMEOUT,
+        )
+        return output
+    finally:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+
+
 def split_video(duration_seconds: int, input_path: Path, output_dir: Path, n_parts: int) -> list[Path]:
     if not duration_seconds:
         raise ValueError(f"Cannot split {input_path.name}: duration is 0")
@@ -179,20 +294,18 @@ def split_video(duration_seconds: int, input_path: Path, output_dir: Path, n_par
     log.info('video of %d duration will be split by %d parts of %d seconds', duration_seconds, n_parts, segment_time)
     output_pattern = output_dir / (input_path.stem + "_part_%03d.mp4")
 
-    subprocess.run(
-        [
-            "ffmpeg",
-            "-i", str(input_path),
-            "-c", "copy",
-            "-f", "segment",
-            "-segment_time", str(segment_time),
-            "-reset_timestamps", "1",
-            str(output_pattern)
-        ],
-        check=True,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL,
-    )
+    with cpu_slot():
+        run_ffmpeg(
+            [
+                "-i", str(input_path),
+                "-c", "copy",
+                "-f", "segment",
+                "-segment_time", str(segment_time),
+                "-reset_timestamps", "1",
+                str(output_pattern)
+            ],
+            timeout=_REMUX_TIMEOUT,
+        )
 
     parts = sorted(output_dir.glob(input_path.stem + "_part_*.mp4"))
     if len(parts) != n_parts:
@@ -200,16 +313,80 @@ def split_video(duration_seconds: int, input_path: Path, output_dir: Path, n_par
     return parts
 
 
+def pick_progressive(
+    video: YouTubeVideoData,
+    output_path: Path,
+    min_res: int,
+    max_res: int = settings.max_video_resolution,
+    itag: int | None = None,
+) -> tuple[Stream, Path] | None:
+    """
+    Fast path for Shorts and other short videos: a progressive (audio and
+    video muxed) mp4 that fits both the resolution cap and one upload is
+    downloaded as-is -- one request, no separate audio download, no merge.
+    Returns None whenever the regular adaptive path has to run instead.
+    """
+    if not video.yt.length or video.yt.length > settings.youtube_progressive_max_seconds:
+        return None
+    if settings.enable_audio_translation and video.target_lang != TargetLang.ORIGINAL:
+        return None  # translation replaces the audio track, that needs the adaptive streams
+
+    streams = video.yt.streams.filter(progressive=True, file_extension='mp4').order_by('resolution').desc()
+    candidates = [
+        s for s in streams
+        if s.resolution
+        and min_res <= int(s.resolution.replace('p', '')) <= max_res
+        and 'avc1' in s.codecs[0]
+        and s.filesize <= MAX_FILE_SIZE_BYTES * 0.98
+        and (itag is None or s.itag == itag)
+    ]
+    if not candidates:
+        return None
+
+    stream = candidates[0]
+    log.info('downloading progressive stream %s', stream)
+    file_path = Path(stream.download(output_path=str(output_path), filename=f'{video.yt.video_id}.{stream.itag}.mp4'))
+    if file_path.stat().st_size > MAX_FILE_SIZE_BYTES:
+        log.info('progressive stream %s is bigger than announced, taking the adaptive path', stream)
+        file_path.unlink()
+        return None
+    return stream, file_path
+
+
+def extract_audio(video_path: Path, output_dir: Path) -> Path:
+    """Copies the audio track out of a muxed mp4, re-encoding it only if it isn't AAC."""
+    audio_path = output_dir / f'{video_path.stem}.audio.m4a'
+    if get_audio_codec(video_path) == 'aac':
+        # a stream copy is disk I/O, it needn't wait for (or hold) a CPU slot
+        run_ffmpeg(['-i', str(video_path), '-vn', '-c:a', 'copy', str(audio_path)], timeout=_REMUX_TIMEOUT)
+    else:
+        with cpu_slot():
+            run_ffmpeg(['-i', str(video_path), '-vn', '-c:a', 'aac', str(audio_path)], timeout=_REMUX_TIMEOUT)
+    return audio_path
+
+
 @translates_youtube_errors
 def check_download_adaptive(
     video: YouTubeVideoData,
     output_path: str,
     min_res: int = 360,
     max_res: int = settings.max_video_resolution,
-) -> tuple[Stream, list[Path]]:
+    itag: int | None = None,
+    min_parts: int = 1,
+) -> tuple[Stream, list[Path], Path | None]:
+    """
+    Downloads the video ready for upload: the stream used, the part files, and
+    the original audio track (None when the video came progressive, see
+    extract_audio).
+    """
     output_path = Path(output_path)
+    if progressive := pick_progressive(video, output_path, min_res, max_res, itag):
+        stream, file_path = progressive
+        log.info('took the progressive fast path: %s', stream)
+        return stream, [file_path], None
+
     # pick one that fits best
-    video_stream, n_parts, video_path = pick_stream(video, output_path, min_res, max_res)
+    video_stream, n_parts, video_path, audio_path = pick_stream(video, output_path, min_res, max_res, itag, min_parts)
 
     video_paths = []
     while True:
@@ -244,4 +421,4 @@ def check_download_adaptive(
         else:
             break
 
-    return video_stream, video_paths
+    return video_stream, video_paths, audio_path
@@ -0,0 +1,104 @@
+"""
+The Whisper model behind source language detection: loaded once per worker
+process, under a lock, and unloaded after settings.whisper_idle_unload idle
+seconds. Past settings.whisper_queue_size detections running or waiting,
+detection is skipped and the video goes out untranslated.
+"""
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING
+
+from bot.config import settings
+from bot.util.concurrency import cpu_slot
+
+if TYPE_CHECKING:
+    from faster_whisper import WhisperModel
+
+log = logging.getLogger(__name__)
+
+
+class WhisperService:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._model = None
+        self._queue = threading.BoundedSemaphore(settings.whisper_queue_size)
+        self._workers = threading.BoundedSemaphore(settings.whisper_num_workers)
+        self._in_flight = 0
+        self._last_used = 0.0
+        self._unload_timer: threading.Timer | None = None
+
+    def _loaded(self) -> "WhisperModel":
+        """The model, loading it first if need be. Call with the lock held."""
+        if self._model is None:
+            # faster_whisper (ctranslate2) costs seconds and tens of MB just to
+            # import, and only translated videos need it
+            from faster_whisper import WhisperModel
+
+            started = time.monotonic()
+            self._model = WhisperModel(
+                settings.whisper_model,
+                device="cpu",
+                cpu_threads=settings.whisper_cpu_threads,
+                num_workers=settings.whisper_num_workers,
+            )
+            log.info("whisper %r model loaded in %.1fs", settings.whisper_model, time.monotonic() - started)
+        return self._model
+
+    def warm_up(self) -> None:
+        """Loads the model in the background, so the first detection doesn't pay for it."""
+
+        def load() -> None:
+            try:
+                with self._lock:
+                    self._loaded()
+                    self._last_used = time.monotonic()
+                    self._schedule_unload()
+            except Exception:
+                log.exception("failed to preload the whisper model")
+
+        threading.Thread(target=load, name="whisper-warm-up", daemon=True).start()
+
+    def detect_language(self, audio_path: str) -> tuple[str, float] | None:
+        """(language code, probability) of the audio, or None when the queue is full."""
+        if not self._queue.acquire(blocking=False):
+            log.warning("whisper queue is full (%d), skipping language detection", settings.whisper_queue_size)
+            return None
+        try:
+            with self._lock:
+                model = self._loaded()
+                # counted only once loaded: a failed load has nothing to uncount
+                self._in_flight += 1
+            try:
+                with self._workers, cpu_slot():
+                    # transcribe just to get language info (no need to iterate over segments)
+                    _, info = model.transcribe(audio_path, beam_size=5)
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+                    self._last_used = time.monotonic()
+                    self._schedule_unload()
+        finally:
+            self._queue.release()
+        return info.language, info.language_probability
+
+    def _schedule_unload(self) -> None:
+        """(Re)arms the idle unload. Call with the lock held."""
+        if not settings.whisper_idle_unload or self._in_flight:
+            return
+        if self._unload_timer is not None:
+            self._unload_timer.cancel()
+        self._unload_timer = threading.Timer(settings.whisper_idle_unload, self._unload_if_idle)
+        self._unload_timer.daemon = True
+        self._unload_timer.start()
+
+    def _unload_if_idle(self) -> None:
+        with self._lock:
+            idle = time.monotonic() - self._last_used
+            if self._model is None or self._in_flight or idle < settings.whisper_idle_unload:
+                return
+            self._model = None
+        log.info("whisper model unloaded after %ds idle", idle)
+
+
+whisper = WhisperService()
@@ -1,22 +1,25 @@
-import asyncio
 import logging
 import tempfile
 from pathlib import Path
 
 import dramatiq
 import redis.asyncio as redis
-from aiogram import Bot, types
+from aiogram import Bot
 from aiogram.enums import ChatAction
-from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError
+from aiogram.exceptions import TelegramBadRequest
+from dramatiq.middleware import CurrentMessage
 from redis.asyncio.lock import Lock
 
-from bot.config import settings
 from bot.events.signals import on_social_video_sent, on_yt_video_sent
 from bot.util.audio.download import probe_link
 from bot.util.audio.exc import AudioDownloadError
 from bot.util.audio.pager import redeliver_page
 from bot.util.audio.schema import AudioRequestData, AudioTrackData
+from bot.util.cache import cache_get, cache_set, remember_failure
 from bot.util.chat import is_group_chat
+from bot.util.codec import decode, encode
+from bot.util.concurrency import run_blocking
+from bot.util.redis import current_redis_client
 from bot.util.redis_lock import HeartbeatLock
 from bot.util.social.exc import SocialDownloadError
 from bot.util.social.schema import SocialVideoData
@@ -27,15 +30,26 @@ from bot.util.youtube.video import get_audio_stream
 from bot.worker.broker import (
     broker,  # noqa: F401 -- registers the Redis broker before actors are declared
 )
-from bot.worker.chat_action import with_chat_action
+from bot.worker.chat_action import cover_waiters, with_chat_action
+from bot.worker.checkpoint import clear_checkpoint
+from bot.worker.dump import upload_to_dump
 from bot.worker.error_reporting import (
     report_actor_failure,  # noqa: F401 -- registers the actor with the broker
 )
+from bot.worker.messages import ACTOR_STUBS
 from bot.worker.pipeline import (
     handle_audio_page,
     handle_social_video,
     handle_youtube_video,
 )
+from bot.worker.queues import (
+    AUDIO_QUEUE,
+    SOCIAL_QUEUE,
+    YOUTUBE_QUEUE,
+    send_to_queue,
+    youtube_queue_for,
+)
+from bot.worker.runtime import run_job
 from bot.worker.waiters import Waiter, pop_waiters
 
 log = logging.getLogger(__name__)
@@ -59,18 +73,6 @@ async def _safe_delete_ack(bot: Bot, chat_id: int, message_id: int | None) -> No
         log.warning("could not delete ack message %s in chat %s", message_id, chat_id)
 
 
-async def _pop_waiters(redis_client: redis.Redis, cache_key: str) -> list[Waiter]:
-    """pop_waiters, deduped by chat_id so a re-sent link/re-tapped button can't cause a double delivery."""
-    waiters = await pop_waiters(redis_client, cache_key)
-    seen: set[int] = set()
-    deduped = []
-    for waiter in waiters:
-        if waiter.chat_id not in seen:
-            seen.add(waiter.chat_id)
-            deduped.append(waiter)
-    return deduped
-
-
 async def _notify_waiters_success(bot: Bot, waiters: list[Waiter], video) -> None:
     for waiter in waiters:
         await _safe_delete_ack(bot, waiter.chat_id, waiter.ack_message_id)
@@ -88,6 +90,14 @@ async def _notify_waiters_failure(bot: Bot, waiters: list[Waiter], text: str) ->
             await bot.send_message(waiter.chat_id, text, reply_to_message_id=waiter.reply_to_message_id)
 
 
+async def _fail_permanently(bot: Bot, redis_client: redis.Redis, cache_key: str, text: str) -> None:
+    # remembered before the waiters are popped, so a request arriving in between
+    # is answered from the negative cache rather than enqueueing another job
+    await remember_failure(redis_client, cache_key, text)
+    waiters = await pop_waiters(redis_client, cache_key)
+    await _notify_waiters_failure(bot, waiters, text)
+
+
 async def _notify_audio_waiters_success(bot: Bot, waiters: list[Waiter], video: YouTubeVideoData) -> None:
     for waiter in waiters:
         await bot.send_audio(
@@ -105,22 +115,16 @@ async def _resolve_cached_tracks(redis_client: redis.Redis, tracks: list[AudioTr
     for track in tracks:
         if track.file_id:
             continue
-        cached_raw = await redis_client.get(track.cache_key)
+        cached_raw = await cache_get(redis_client, track.cache_key)
         if not cached_raw:
             continue
-        cached = AudioTrackData.model_validate_json(cached_raw)
+        cached = decode(AudioTrackData, cached_raw)
         track.file_id = cached.file_id
         track.title = track.title or cached.title
         track.uploader = track.uploader or cached.uploader
         track.duration = track.duration or cached.duration
 
 
-async def _save_tracks_to_cache(redis_client: redis.Redis, tracks: list[AudioTrackData]) -> None:
-    for track in tracks:
-        if track.file_id:
-            await redis_client.set(track.cache_key, track.model_dump_json())
-
-
 async def _notify_audio_page_waiters_success(
     redis_client: redis.Redis, bot: Bot, waiters: list[Waiter], audio: AudioRequestData, page: int,
 ) -> None:
@@ -128,34 +132,54 @@ async def _notify_audio_page_waiters_success(
         await redeliver_page(redis_client, bot, waiter.chat_id, waiter.reply_to_message_id, audio, page)
 
 
-@with_chat_action()
-async def _process_youtube_link_async(bot: Bot, chat_id: int, link: str, target_lang_value: str) -> None:
-    redis_client = redis.from_url(str(settings.redis_dsn), decode_responses=True)
+def _video_length(video: YouTubeVideoData) -> int | None:
     try:
-        target_lang = TargetLang(target_lang_value)
-        video = YouTubeVideoData.model_validate(dict(link=link, target_lang=target_lang))
+        return video.yt.length
+    except Exception as e:
+        # the job itself will run into it and report it properly
+        log.info("could not get the duration of %s for routing: %r", video.link, e)
+        return None
+
+
+@with_chat_action()
+async def _process_youtube_link_async(
+    bot: Bot, chat_id: int, link: str, target_lang_value: str, queue_name: str,
+) -> None:
+    redis_client = current_redis_client()
+    target_lang = TargetLang(target_lang_value)
+    video = YouTubeVideoData.model_validate(dict(link=link, target_lang=target_lang))
+    cover_waiters(video.cache_key)
+
+    # Shorts are capped at a few minutes, no need to ask. The player response
+    # is shared through Redis, so the youtube_long worker doesn't fetch it again.
+    if queue_name == YOUTUBE_QUEUE and "/shorts/" not in link:
+        routed_to = youtube_queue_for(await run_blocking(_video_length, video))
+        if routed_to != queue_name:
+            log.info("%s is a long video, moving it to the %s queue", video.cache_key, routed_to)
+            send_to_queue(process_youtube_link, routed_to, chat_id, link, target_lang_value)
+            return
 
-        lock = Lock(redis_client, f'{video.cache_key}:lock', timeout=10 * 60, blocking_timeout=11 * 60)
-        async with HeartbeatLock(lock):
-            try:
-                video = await handle_youtube_video(bot, video)
-            except YouTubeError as e:
-                waiters = await _pop_waiters(redis_client, video.cache_key)
-                await _notify_waiters_failure(bot, waiters, f"❌ Couldn't process this video: {e}")
-                raise
+    lock = Lock(redis_client, f'{video.cache_key}:lock', timeout=10 * 60, blocking_timeout=11 * 60)
+    async with HeartbeatLock(lock):
+        try:
+            video = await handle_youtube_video(bot, video)
+        except YouTubeError as e:
+            await _fail_permanently(bot, redis_client, video.cache_key, f"❌ Couldn't process this video: {e}")
+            raise
 
-            await redis_client.set(video.cache_key, video.model_dump_json())
-            log.info("cached %s (%d files)", video.cache_key, len(video.file_ids))
+        await cache_set(redis_client, video.cache_key, encode(video))
+        await clear_checkpoint(redis_client, video.cache_key)
+        log.info("cached %s (%d files)", video.cache_key, len(video.file_ids))
 
-            waiters = await _pop_waiters(redis_client, video.cache_key)
-            await _notify_waiters_success(bot, waiters, video)
-            for waiter in waiters:
-                await on_yt_video_sent.send(link, waiter.chat_id, waiter.chat_type, bot, video, True)
-    finally:
-        await redis_client.aclose()
+        waiters = await pop_waiters(redis_client, video.cache_key)
+        await _notify_waiters_success(bot, waiters, video)
+        for waiter in waiters:
+            await on_yt_video_sent.send(link, waiter.chat_id, waiter.chat_type, bot, video, True)
 
 
 @dramatiq.actor(
+    queue_name=YOUTUBE_QUEUE,
+    priority=20,
     max_retries=2,
     min_backoff=30_000,
     max_backoff=5 * 60_000,
@@ -164,73 +188,58 @@ async def _process_youtube_link_async(bot: Bot, chat_id: int, link: str, target_
     on_retry_exhausted="report_actor_failure",
 )
 def process_youtube_link(chat_id: int, link: str, target_lang: str):
-    bot = Bot(token=settings.bot_token)
-    try:
-        asyncio.run(_process_youtube_link_async(bot, chat_id, link, target_lang))
-    finally:
-        asyncio.run(bot.session.close())
+    # read here, in the worker thread: CurrentMessage doesn't reach the
+    # shared event loop of the asyncio mode
+    message = CurrentMessage.get_current_message()
+    queue_name = message.queue_name if message else YOUTUBE_QUEUE
+    run_job(_process_youtube_link_async, chat_id, link, target_lang, queue_name)
 
 
 @with_chat_action(ChatAction.UPLOAD_VOICE)
 async def _process_youtube_audio_async(bot: Bot, chat_id: int, video_id: str, reply_to_message_id: int) -> None:
-    redis_client = redis.from_url(str(settings.redis_dsn), decode_responses=True)
-    try:
-        cache_key = f"yt:{video_id}"
-        audio_waiters_key = f"{cache_key}:audio"
-
-        video_raw = await redis_client.get(cache_key)
-        if not video_raw:
-            log.error("cache entry %s vanished before audio extraction could run", cache_key)
-            waiters = await _pop_waiters(redis_client, audio_waiters_key)
-            await _notify_waiters_failure(bot, waiters, "❌ This video is no longer cached, please resend the link.")
-            return
+    redis_client = current_redis_client()
+    cache_key = f"yt:{video_id}"
+    audio_waiters_key = f"{cache_key}:audio"
+    cover_waiters(audio_waiters_key)
+
+    video_raw = await cache_get(redis_client, cache_key)
+    if not video_raw:
+        log.error("cache entry %s vanished before audio extraction could run", cache_key)
+        waiters = await pop_waiters(redis_client, audio_waiters_key)
+        await _notify_waiters_failure(bot, waiters, "❌ This video is no longer cached, please resend the link.")
+        return
+
+    video = decode(YouTubeVideoData, video_raw)
+
+    lock = Lock(redis_client, f'{audio_waiters_key}:lock', timeout=10 * 60, blocking_timeout=11 * 60)
+    async with HeartbeatLock(lock):
+        if not video.audio_file_id:
+            with tempfile.TemporaryDirectory() as tmp:
+                try:
+                    audio_path = await run_blocking(get_audio_stream, video, Path(tmp))
+                except YouTubeError as e:
+                    await _fail_permanently(bot, redis_client, audio_waiters_key, f"❌ Couldn't extract audio: {e}")
+                    raise
+
+                video.capture_metadata()
+                video.audio_file_id = await upload_to_dump(
+                    bot, "audio", Path(audio_path), performer=video.author, title=video.title, duration=video.length,
+                )
 
-        video = YouTubeVideoData.model_validate_json(video_raw)
-
-        lock = Lock(redis_client, f'{audio_waiters_key}:lock', timeout=10 * 60, blocking_timeout=11 * 60)
-        async with HeartbeatLock(lock):
-            if not video.audio_file_id:
-                with tempfile.TemporaryDirectory() as tmp:
-                    try:
-                        audio_path = await asyncio.to_thread(get_audio_stream, video, Path(tmp))
-                    except YouTubeError as e:
-                        waiters = await _pop_waiters(redis_client, audio_waiters_key)
-                        await _notify_waiters_failure(bot, waiters, f"❌ Couldn't extract audio: {e}")
-                        raise
-
-                    video.capture_metadata()
-
-                    for i in range(3):
-                        try:
-                            media_message = await bot.send_audio(
-                                settings.dump_chat_id,
-                                types.FSInputFile(audio_path),
-                                performer=video.author,
-                                title=video.title,
-                                duration=video.length,
-                            )
-                            break
-                        except TelegramNetworkError:
-                            if i == 2:
-                                raise
-                            log.warning('failed to send an audio file, retrying in 2 seconds')
-                            await asyncio.sleep(2)
-
-                video.audio_file_id = media_message.audio.file_id
-                await redis_client.set(cache_key, video.model_dump_json())
-                log.info("cached audio for %s", cache_key)
-
-            if await asyncio.to_thread(video.ensure_metadata):
-                # promote a pre-metadata entry so the next tap skips YouTube entirely
-                await redis_client.set(cache_key, video.model_dump_json())
-
-            waiters = await _pop_waiters(redis_client, audio_waiters_key)
-            await _notify_audio_waiters_success(bot, waiters, video)
-    finally:
-        await redis_client.aclose()
+            await cache_set(redis_client, cache_key, encode(video))
+            log.info("cached audio for %s", cache_key)
+
+        if await run_blocking(video.ensure_metadata):
+            # promote a pre-metadata entry so the next tap skips YouTube entirely
+            await cache_set(redis_client, cache_key, encode(video))
+
+        waiters = await pop_waiters(redis_client, audio_waiters_key)
+        await _notify_audio_waiters_success(bot, waiters, video)
 
 
 @dramatiq.actor(
+    queue_name=AUDIO_QUEUE,
+    priority=0,
     max_retries=2,
     min_backoff=30_000,
     max_backoff=5 * 60_000,
@@ -239,63 +248,57 @@ async def _process_youtube_audio_async(bot: Bot, chat_id: int, video_id: str, re
     on_retry_exhausted="report_actor_failure",
 )
 def process_youtube_audio(chat_id: int, video_id: str, reply_to_message_id: int):
-    bot = Bot(token=settings.bot_token)
-    try:
-        asyncio.run(_process_youtube_audio_async(bot, chat_id, video_id, reply_to_message_id))
-    finally:
-        asyncio.run(bot.session.close())
+    run_job(_process_youtube_audio_async, chat_id, video_id, reply_to_message_id)
 
 
 @with_chat_action()
 async def _process_social_link_async(bot: Bot, chat_id: int, url: str) -> None:
-    redis_client = redis.from_url(str(settings.redis_dsn), decode_responses=True)
-    try:
-        video = SocialVideoData.model_validate(dict(link=url))
-
-        lock = Lock(redis_client, f'{video.cache_key}:lock', timeout=20 * 60, blocking_timeout=21 * 60)
-        async with HeartbeatLock(lock):
-            try:
-                is_audio, tracks = await asyncio.to_thread(probe_link, url)
-            except AudioDownloadError as e:
-                waiters = await _pop_waiters(redis_client, video.cache_key)
-                await _notify_waiters_failure(bot, waiters, f"❌ Couldn't process this link: {e}")
-                raise
-
-            if is_audio:
-                audio = AudioRequestData(link=url, tracks=tracks)
-                page_tracks = audio.page(1)
-                await _resolve_cached_tracks(redis_client, page_tracks)
-                failed = await handle_audio_page(bot, page_tracks)
-                await _save_tracks_to_cache(redis_client, page_tracks)
-                await redis_client.set(audio.cache_key, audio.model_dump_json())
-                log.info(
-                    "cached %s (%d tracks total, page 1 ready, %d failed)",
-                    audio.cache_key, len(audio.tracks), failed,
-                )
-
-                waiters = await _pop_waiters(redis_client, video.cache_key)
-                await _notify_waiters_success(bot, waiters, audio)
-                return
+    redis_client = current_redis_client()
+    video = SocialVideoData.model_validate(dict(link=url))
+    cover_waiters(video.cache_key)
+
+    lock = Lock(redis_client, f'{video.cache_key}:lock', timeout=20 * 60, blocking_timeout=21 * 60)
+    async with HeartbeatLock(lock):
+        try:
+            is_audio, tracks = await run_blocking(probe_link, url)
+        except AudioDownloadError as e:
+            await _fail_permanently(bot, redis_client, video.cache_key, f"❌ Couldn't process this link: {e}")
+            raise
+
+        if is_audio:
+            audio = AudioRequestData(link=url, tracks=tracks)
+            page_tracks = audio.page(1)
+            await _resolve_cached_tracks(redis_client, page_tracks)
+            failed = await handle_audio_page(bot, page_tracks)
+            await cache_set(redis_client, audio.cache_key, encode(audio))
+            log.info(
+                "cached %s (%d tracks total, page 1 ready, %d failed)",
+                audio.cache_key, len(audio.tracks), failed,
+            )
+
+            waiters = await pop_waiters(redis_client, video.cache_key)
+            await _notify_waiters_success(bot, waiters, audio)
+            return
 
-            try:
-                video = await handle_social_video(bot, video)
-            except SocialDownloadError as e:
-                waiters = await _pop_waiters(redis_client, video.cache_key)
-                await _notify_waiters_failure(bot, waiters, f"❌ Couldn't download this video: {e}")
-                raise
+        try:
+            video = await handle_social_video(bot, video)
+        except SocialDownloadError as e:
+            await _fail_permanently(bot, redis_client, video.cache_key, f"❌ Couldn't download this video: {e}")
+            raise
 
-            await redis_client.set(video.cache_key, video.model_dump_json())
-            log.info("cached %s (%s)", video.cache_key, video.origin)
+        await cache_set(redis_client, video.cache_key, encode(video))
+        await clear_checkpoint(redis_client, video.cache_key)
+        log.info("cached %s (%s)", video.cache_key, video.origin)
 
-            waiters = await _pop_waiters(redis_client, video.cache_key)
-            await _notify_waiters_success(bot, waiters, video)
-            for waiter in waiters:
-                await on_social_video_sent.send(url, waiter.chat_id, waiter.chat_type, bot, video, True)
-    finally:
-        await redis_client.aclose()
+        waiters = await pop_waiters(redis_client, video.cache_key)
+        await _notify_waiters_success(bot, waiters, video)
+        for waiter in waiters:
+            await on_social_video_sent.send(url, waiter.chat_id, waiter.chat_type, bot, video, True)
 
 
 @dramatiq.actor(
+    queue_name=SOCIAL_QUEUE,
+    priority=10,
     max_retries=2,
     min_backoff=30_000,
     max_backoff=5 * 60_000,
@@ -304,45 +307,40 @@ async def _process_social_link_async(bot: Bot, chat_id: int, url: str) -> None:
     on_retry_exhausted="report_actor_failure",
 )
 def process_social_link(chat_id: int, url: str):
-    bot = Bot(token=settings.bot_token)
-    try:
-        asyncio.run(_process_social_link_async(bot, chat_id, url))
-    finally:
-        asyncio.run(bot.session.close())
+    run_job(_process_social_link_async, chat_id, url)
 
 
 @with_chat_action(ChatAction.UPLOAD_VOICE)
 async def _process_audio_page_async(bot: Bot, chat_id: int, hash16: str, page: int) -> None:
-    redis_client = redis.from_url(str(settings.redis_dsn), decode_responses=True)
-    try:
-        cache_key = f"da:{hash16}"
-        page_key = f"{cache_key}:page:{page}"
-
-        audio_raw = await redis_client.get(cache_key)
-        if not audio_raw:
-            log.error("cache entry %s vanished before page %d could be processed", cache_key, page)
-            waiters = await _pop_waiters(redis_client, page_key)
-            await _notify_waiters_failure(bot, waiters, "❌ This playlist is no longer cached, please resend the link.")
-            return
+    redis_client = current_redis_client()
+    cache_key = f"da:{hash16}"
+    page_key = f"{cache_key}:page:{page}"
+    cover_waiters(page_key)
+
+    audio_raw = await cache_get(redis_client, cache_key)
+    if not audio_raw:
+        log.error("cache entry %s vanished before page %d could be processed", cache_key, page)
+        waiters = await pop_waiters(redis_client, page_key)
+        await _notify_waiters_failure(bot, waiters, "❌ This playlist is no longer cached, please resend the link.")
+        return
 
-        audio = AudioRequestData.model_validate_json(audio_raw)
+    audio = decode(AudioRequestData, audio_raw)
 
-        lock = Lock(redis_client, f'{page_key}:lock', timeout=20 * 60, blocking_timeout=21 * 60)
-        async with HeartbeatLock(lock):
-            page_tracks = audio.page(page)
-            await _resolve_cached_tracks(redis_client, page_tracks)
-            failed = await handle_audio_page(bot, page_tracks)
-            await _save_tracks_to_cache(redis_client, page_tracks)
-            await redis_client.set(cache_key, audio.model_dump_json())
-            log.info("cached %s page %d (%d failed)", cache_key, page, failed)
+    lock = Lock(redis_client, f'{page_key}:lock', timeout=20 * 60, blocking_timeout=21 * 60)
+    async with HeartbeatLock(lock):
+        page_tracks = audio.page(page)
+        await _resolve_cached_tracks(redis_client, page_tracks)
+        failed = await handle_audio_page(bot, page_tracks)
+        await cache_set(redis_client, cache_key, encode(audio))
+        log.info("cached %s page %d (%d failed)", cache_key, page, failed)
 
-            waiters = await _pop_waiters(redis_client, page_key)
-            await _notify_audio_page_waiters_success(redis_client, bot, waiters, audio, page)
-    finally:
-        await redis_client.aclose()
+        waiters = await pop_waiters(redis_client, page_key)
+        await _notify_audio_page_waiters_success(redis_client, bot, waiters, audio, page)
 
 
 @dramatiq.actor(
+    queue_name=AUDIO_QUEUE,
+    priority=10,
     max_retries=2,
     min_backoff=30_000,
     max_backoff=5 * 60_000,
@@ -351,8 +349,10 @@ async def _process_audio_page_async(bot: Bot, chat_id: int, hash16: str, page: i
     on_retry_exhausted="report_actor_failure",
 )
 def process_audio_page(chat_id: int, hash16: str, page: int):
-    bot = Bot(token=settings.bot_token)
-    try:
-        asyncio.run(_process_audio_page_async(bot, chat_id, hash16, page))
-    finally:
-        asyncio.run(bot.session.close())
+    run_job(_process_audio_page_async, chat_id, hash16, page)
+
+
+# the bot enqueues these through bot.worker.messages, without seeing the declarations above
+for _stub in ACTOR_STUBS:
+    if broker.get_actor(_stub.actor_name).queue_name != _stub.queue_name:
+        raise RuntimeError(f"stale stub for {_stub.actor_name} in bot.worker.messages")
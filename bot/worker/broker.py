@@ -1,7 +1,10 @@
 import dramatiq
 from dramatiq.brokers.redis import RedisBroker
+from dramatiq.middleware import CurrentMessage
 
 from bot.config import settings
 
 broker = RedisBroker(url=str(settings.redis_dsn))
+# process_youtube_link needs to know which queue its message came from
+broker.add_middleware(CurrentMessage())
 dramatiq.set_broker(broker)
@@ -1,24 +1,174 @@
 import asyncio
+import itertools
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
 from functools import wraps
 
 from aiogram import Bot
 from aiogram.enums import ChatAction
+from aiogram.exceptions import TelegramAPIError
+from redis.asyncio import Redis
 
-from bot.util.chat_action import send_chat_action_periodically
+from bot.config import settings
+from bot.util.redis import create_redis_client, use_redis_client
+from bot.util.telegram import create_bot
+from bot.worker.waiters import peek_waiters
+
+log = logging.getLogger(__name__)
+
+_INTERVAL = 4  # seconds; an action shows for ~5s, so this keeps it on without gaps
+# a job ends well within its actor's time limit; a registration older than this leaked
+_MAX_AGE = 60 * 60
+
+
+@dataclass(eq=False)
+class _Registration:
+    chat_id: int
+    action: ChatAction
+    expires_at: float
+    waiters_key: str | None = None  # cache key whose waiters also see the action, see cover_waiters
+    id: int = field(default_factory=itertools.count().__next__)
+
+
+class ChatActionScheduler:
+    """
+    Keeps "uploading video..." showing in every chat that waits on a job of
+    this worker process: the one that started the job and all the waiters
+    registered on its cache key since.
+
+    Jobs only add and remove registrations; one thread with its own loop, Bot
+    (behind the shared rate limiter, like every Bot here) and Redis client
+    sends everything that's due on a single timer, each (chat, action) at most
+    once per interval however many jobs it waits on -- instead of an asyncio
+    task per job, each signalling only its initiating chat.
+    """
+
+    def __init__(self, interval: float = _INTERVAL) -> None:
+        self._interval = interval
+        self._registrations: dict[int, _Registration] = {}
+        self._lock = threading.Lock()
+        self._last_sent: dict[tuple[int, ChatAction], float] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wake: asyncio.Event | None = None
+        self._thread: threading.Thread | None = None
+
+    def register(self, chat_id: int, action: ChatAction) -> _Registration:
+        registration = _Registration(chat_id, action, time.monotonic() + _MAX_AGE)
+        with self._lock:
+            self._registrations[registration.id] = registration
+            # (re)started here: a scheduler thread that died must not leave
+            # the worker without chat actions for good
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="chat-action-scheduler", daemon=True)
+                self._thread.start()
+        self.wake()
+        return registration
+
+    def unregister(self, registration: _Registration) -> None:
+        with self._lock:
+            self._registrations.pop(registration.id, None)
+
+    def wake(self) -> None:
+        """Sends what's newly due now rather than on the next tick."""
+        if self._loop is not None and self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def _run(self) -> None:
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self._serve(loop))
+        except Exception:
+            log.exception("chat action scheduler died, the next registration restarts it")
+        finally:
+            self._loop = self._wake = None
+            loop.close()
+
+    async def _serve(self, loop: asyncio.AbstractEventLoop) -> None:
+        bot = create_bot(settings.bot_token)
+        redis_client = create_redis_client()
+        use_redis_client(redis_client)  # for the rate limiter's buckets
+        self._wake = asyncio.Event()
+        self._loop = loop
+        try:
+            while True:
+                self._wake.clear()
+                try:
+                    await self._tick(bot, redis_client)
+                except Exception:
+                    log.exception("chat action tick failed")
+                with self._lock:
+                    idle = not self._registrations
+                # nothing registered: sleep until a job registers
+                timeout = None if idle else self._interval
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                except TimeoutError:
+                    pass
+        finally:
+            await bot.session.close()
+            await redis_client.aclose()
+
+    async def _targets(self, redis_client: Redis) -> set[tuple[int, ChatAction]]:
+        now = time.monotonic()
+        with self._lock:
+            for registration in [r for r in self._registrations.values() if r.expires_at < now]:
+                log.warning("dropping chat action registration for %s, its job never ended", registration.chat_id)
+                del self._registrations[registration.id]
+            registrations = list(self._registrations.values())
+
+        targets = {(r.chat_id, r.action) for r in registrations}
+        covered = [r for r in registrations if r.waiters_key]
+        if covered:
+            waiters = await peek_waiters(redis_client, [r.waiters_key for r in covered])
+            for registration, key_waiters in zip(covered, waiters, strict=True):
+                targets.update((w.chat_id, registration.action) for w in key_waiters)
+        return targets
+
+    async def _tick(self, bot: Bot, redis_client: Redis) -> None:
+        targets = await self._targets(redis_client)
+        now = time.monotonic()
+        # forget chats nobody waits in anymore, so a new job there starts right away
+        self._last_sent = {t: sent_at for t, sent_at in self._last_sent.items() if t in targets}
+        due = [t for t in targets if now - self._last_sent.get(t, 0) >= self._interval - 0.5]
+        for target in due:
+            self._last_sent[target] = now
+        await asyncio.gather(*(self._send(bot, chat_id, action) for chat_id, action in due))
+
+    @staticmethod
+    async def _send(bot: Bot, chat_id: int, action: ChatAction) -> None:
+        try:
+            await bot.send_chat_action(chat_id=chat_id, action=action)
+        except TelegramAPIError as e:
+            # cosmetic: a chat that blocked the bot or a blip isn't worth more than a debug line
+            log.debug("failed to send %s to %s: %r", action, chat_id, e)
+
+
+scheduler = ChatActionScheduler()
+
+_current: ContextVar[_Registration | None] = ContextVar("chat_action_registration", default=None)
+
+
+def cover_waiters(cache_key: str) -> None:
+    """Extends the running job's chat action to every chat waiting on `cache_key` (see bot.worker.waiters)."""
+    registration = _current.get()
+    if registration is not None:
+        registration.waiters_key = cache_key
+        scheduler.wake()
 
 
 def with_chat_action(action: ChatAction = ChatAction.UPLOAD_VIDEO):
     def decorator(func):
         @wraps(func)
         async def wrapper(bot: Bot, chat_id: int, *args, **kwargs):
-            action_task = await send_chat_action_periodically(bot, chat_id, action)
+            registration = scheduler.register(chat_id, action)
+            token = _current.set(registration)
             try:
                 return await func(bot, chat_id, *args, **kwargs)
             finally:
-                action_task.cancel()
-                try:
-                    await action_task
-                except asyncio.CancelledError:
-                    pass
+                _current.reset(token)
+                scheduler.unregister(registration)
         return wrapper
     return decorator
@@ -0,0 +1,50 @@
+from pydantic import BaseModel, Field
+from redis.asyncio import Redis
+
+# outlives the actors' whole retry budget (~2.5h), like the waiters list
+_CHECKPOINT_TTL = 3 * 60 * 60
+
+
+class Checkpoint(BaseModel):
+    """
+    What earlier attempts of a job already got done, stored next to its cache
+    key. dramatiq retries a failed or killed job from scratch; with this, the
+    retry skips stream selection and re-uploading the parts that made it to
+    the dump chat, and a job that only died before caching skips everything.
+    """
+
+    video: str | None = None  # the video model's json once downloaded (dimensions, metadata)
+    itag: int | None = None  # youtube: the stream chosen
+    n_parts: int | None = None
+    file_ids: dict[int, str] = Field(default_factory=dict)  # part index -> file_id
+
+    def expect_parts(self, n_parts: int) -> None:
+        """Records the part count; parts uploaded for a different split don't line up, so drop them."""
+        if self.n_parts != n_parts:
+            self.file_ids = {}
+        self.n_parts = n_parts
+
+    @property
+    def complete(self) -> bool:
+        return self.video is not None and self.n_parts is not None and len(self.file_ids) == self.n_parts
+
+    def ordered_file_ids(self) -> list[str]:
+        return [self.file_ids[i] for i in sorted(self.file_ids)]
+
+
+def _checkpoint_key(cache_key: str) -> str:
+    return f"{cache_key}:checkpoint"
+
+
+async def load_checkpoint(redis_client: Redis, cache_key: str) -> Checkpoint:
+    raw = await redis_client.get(_checkpoint_key(cache_key))
+    return Checkpoint.model_validate_json(raw) if raw else Checkpoint()
+
+
+async def save_checkpoint(redis_client: Redis, cache_key: str, checkpoint: Checkpoint) -> None:
+    await redis_client.set(_checkpoint_key(cache_key), checkpoint.model_dump_json(), ex=_CHECKPOINT_TTL)
+
+
+async def clear_checkpoint(redis_client: Redis, cache_key: str) -> None:
+    """Drops the checkpoint once the job's result is cached."""
+    await redis_client.delete(_checkpoint_key(cache_key))
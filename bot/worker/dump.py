@@ -0,0 +1,104 @@
+import asyncio
+import logging
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Literal
+
+from aiogram import Bot, types
+from aiogram.exceptions import TelegramNetworkError
+
+from bot.config import settings
+from bot.util.redis import current_redis_client, redis_client
+from bot.util.telegram import input_file
+from bot.worker.runtime import current_runtime
+
+log = logging.getLogger(__name__)
+
+MediaKind = Literal["video", "audio"]
+
+_INFLIGHT_KEY = "dump:inflight"
+
+# Picks the (uploader, chat) slot with the fewest uploads in flight and books
+# it, in one step so two workers can't both pick the same idle slot. ARGV are
+# the candidate slot names; returns the 1-based index of the winner. The hash
+# expires on its own, so counts leaked by a killed worker heal within the hour.
+_PICK_SCRIPT = """
+local best, best_load = 1, nil
+for i, slot in ipairs(ARGV) do
+    local load = math.max(0, tonumber(redis.call('HGET', KEYS[1], slot) or '0'))
+    if best_load == nil or load < best_load then best, best_load = i, load end
+end
+redis.call('HINCRBY', KEYS[1], ARGV[best], 1)
+redis.call('EXPIRE', KEYS[1], 3600)
+return best
+"""
+_pick_script = redis_client.register_script(_PICK_SCRIPT)
+
+
+def dump_chat_ids() -> list[int]:
+    return [settings.dump_chat_id, *settings.dump_chat_ids]
+
+
+@asynccontextmanager
+async def _least_loaded(bots: list[Bot]) -> AsyncIterator[tuple[Bot, int]]:
+    slots = [(b, chat_id) for b in bots for chat_id in dump_chat_ids()]
+    if len(slots) == 1:
+        yield slots[0]
+        return
+
+    client = current_redis_client()
+    names = [f"{b.id}:{chat_id}" for b, chat_id in slots]
+    index = int(await _pick_script(keys=[_INFLIGHT_KEY], args=names, client=client)) - 1
+    try:
+        yield slots[index]
+    finally:
+        await client.hincrby(_INFLIGHT_KEY, names[index], -1)
+
+
+async def _send(uploader: Bot, kind: MediaKind, chat_id: int, file_path: Path, **kwargs: Any) -> types.Message:
+    send = uploader.send_video if kind == "video" else uploader.send_audio
+    attempt = 0
+    while True:
+        try:
+            return await send(chat_id, input_file(file_path), **kwargs)
+        except TelegramNetworkError:
+            attempt += 1
+            if attempt == 3:
+                raise
+            log.warning('failed to send %s file %s, retrying in 2 seconds', kind, file_path.name)
+            await asyncio.sleep(2)
+
+
+def _file_id(message: types.Message, kind: MediaKind) -> str:
+    media = message.video if kind == "video" else message.audio
+    if media is None:
+        raise RuntimeError(f"dump chat message carries no {kind}")
+    return media.file_id
+
+
+async def upload_to_dump(bot: Bot, kind: MediaKind, file_path: Path, **kwargs: Any) -> str:
+    """
+    Uploads a file to one of the dump chats and returns a file_id usable by `bot`.
+
+    Uploads fan out over every (uploader token, dump chat) pair -- `bot` itself
+    plus settings.uploader_bot_tokens, times settings.dump_chat_id plus
+    settings.dump_chat_ids -- picking the least busy one, so bursts aren't
+    capped by a single chat's or token's upload rate.
+
+    A file_id only works for the bot that received it, so a file uploaded
+    through another token is forwarded by `bot` (a cheap, upload-free call)
+    and the file_id is taken from the forwarded copy. Everything cached is
+    therefore always owned by the delivering bot.
+    """
+    async with _least_loaded([bot, *current_runtime().uploaders]) as (uploader, chat_id):
+        message = await _send(uploader, kind, chat_id, file_path, **kwargs)
+    if uploader is bot:
+        return _file_id(message, kind)
+
+    async with _least_loaded([bot]) as (_, forward_chat_id):
+        forwarded = await bot.forward_message(
+            forward_chat_id, from_chat_id=chat_id, message_id=message.message_id, disable_notification=True,
+        )
+    log.debug("re-homed %s from uploader %s via chat %s", file_path.name, uploader.id, forward_chat_id)
+    return _file_id(forwarded, kind)
@@ -0,0 +1,21 @@
+"""
+The enqueueing side of the actors, for the bot process.
+
+Importing bot.worker.actors to call `.send()` drags in every job's
+implementation -- the download pipeline, ffmpeg wrappers, yt_dlp and (via
+translation) faster_whisper/ctranslate2 -- none of which the aiogram process
+ever runs. dramatiq routes messages by actor and queue name only; retries,
+time limits and priorities are the worker's own actor options and never
+travel with the message. So a name and a queue are all the bot needs.
+
+bot.worker.actors checks on import that every stub here matches the actor
+it stands for.
+"""
+from bot.worker.queues import AUDIO_QUEUE, SOCIAL_QUEUE, YOUTUBE_QUEUE, ActorStub
+
+process_youtube_link = ActorStub("process_youtube_link", YOUTUBE_QUEUE)
+process_youtube_audio = ActorStub("process_youtube_audio", AUDIO_QUEUE)
+process_social_link = ActorStub("process_social_link", SOCIAL_QUEUE)
+process_audio_page = ActorStub("process_audio_page", AUDIO_QUEUE)
+
+ACTOR_STUBS = (process_youtube_link, process_youtube_audio, process_social_link, process_audio_page)
@@ -4,14 +4,17 @@ import math
 import tempfile
 from pathlib import Path
 
-from aiogram import Bot, types
-from aiogram.exceptions import TelegramNetworkError
+from aiogram import Bot
 
 from bot.config import settings
 from bot.events.signals import on_social_video_fail, on_yt_video_fail
 from bot.util.audio.download import download_track
 from bot.util.audio.exc import AudioDownloadError
 from bot.util.audio.schema import AudioTrackData
+from bot.util.cache import cache_set
+from bot.util.codec import encode
+from bot.util.concurrency import run_blocking
+from bot.util.redis import current_redis_client
 from bot.util.social.download import download_social_video
 from bot.util.social.exc import SocialDownloadError
 from bot.util.social.schema import SocialVideoData
@@ -20,44 +23,50 @@ from bot.util.youtube.schema import YouTubeVideoData
 from bot.util.youtube.video import (
     MAX_FILE_SIZE_BYTES,
     check_download_adaptive,
+    extract_audio,
     get_resolution,
     split_video,
 )
+from bot.worker.checkpoint import Checkpoint, load_checkpoint, save_checkpoint
+from bot.worker.dump import upload_to_dump
 
 log = logging.getLogger(__name__)
 
 
-async def _upload_parts_to_dump_chat(bot: Bot, file_paths: list[Path], width: int, height: int) -> list[str]:
-    file_ids = []
-    for file_path in file_paths:
-        for i in range(3):
-            try:
-                media_message = await bot.send_video(
-                    settings.dump_chat_id,
-                    types.FSInputFile(file_path),
-                    width=width,
-                    height=height,
-                )
-                break
-            except TelegramNetworkError:
-                if i == 2:
-                    raise
-                log.warning('failed to send a video file, retrying in 2 seconds')
-                await asyncio.sleep(2)
+async def _upload_parts_to_dump_chat(
+    bot: Bot, file_paths: list[Path], width: int, height: int, cache_key: str, checkpoint: Checkpoint,
+) -> list[str]:
+    redis_client = current_redis_client()
+    checkpoint.expect_parts(len(file_paths))
+    for i, file_path in enumerate(file_paths):
+        if i in checkpoint.file_ids:
+            log.info("%s was uploaded by an earlier attempt, skipping", file_path)
+            continue
+        checkpoint.file_ids[i] = await upload_to_dump(bot, "video", file_path, width=width, height=height)
+        await save_checkpoint(redis_client, cache_key, checkpoint)
         log.info("sent %s", file_path)
-        file_ids.append(media_message.video.file_id)
-    return file_ids
+    return checkpoint.ordered_file_ids()
 
 
 async def handle_youtube_video(bot: Bot, video: YouTubeVideoData) -> YouTubeVideoData:
+    redis_client = current_redis_client()
+    checkpoint = await load_checkpoint(redis_client, video.cache_key)
+    if checkpoint.complete:
+        log.info("%s was fully uploaded by an earlier attempt", video.cache_key)
+        resumed = YouTubeVideoData.model_validate_json(checkpoint.video)
+        resumed.file_ids = checkpoint.ordered_file_ids()
+        return resumed
+
     with tempfile.TemporaryDirectory() as tmp:
         exc = None
         for i in range(3):
             try:
-                stream, file_paths = await asyncio.to_thread(
+                stream, file_paths, audio_path = await run_blocking(
                     check_download_adaptive,
                     video=video,
                     output_path=tmp,
+                    itag=checkpoint.itag,
+                    min_parts=checkpoint.n_parts or 1,
                 )
                 exc = None
                 break
@@ -67,6 +76,8 @@ async def handle_youtube_video(bot: Bot, video: YouTubeVideoData) -> YouTubeVide
             except Exception as ex:
                 exc = ex
                 log.error("failed to download %s on try #%d: %r", video.yt.video_id, i + 1, exc)
+                # the stream URLs may be what failed: don't retry with the same manifest
+                await run_blocking(video.refresh_yt)
                 await asyncio.sleep(2)
 
         if exc:
@@ -74,25 +85,70 @@ async def handle_youtube_video(bot: Bot, video: YouTubeVideoData) -> YouTubeVide
             await on_yt_video_fail.send(video.link)
             raise exc
 
-        width, height = get_resolution(stream)
+        width, height = await run_blocking(get_resolution, stream, file_paths[0])
         video.width = width
         video.height = height
         # free here (yt just fetched); spares every later redelivery a live lookup
         video.capture_metadata()
 
+        if checkpoint.itag != stream.itag:
+            checkpoint.file_ids = {}
+        checkpoint.itag = stream.itag
+        checkpoint.video = video.model_dump_json()
+
         log.info('sending %d part(s) to dump chat to obtain file ids', len(file_paths))
-        video.file_ids = await _upload_parts_to_dump_chat(bot, file_paths, width, height)
+        video.file_ids = await _upload_parts_to_dump_chat(
+            bot, file_paths, width, height, video.cache_key, checkpoint,
+        )
+        # the entry is the same whatever the target language, so only the
+        # original audio goes on it (the merged one may be a translation)
+        if settings.youtube_upload_audio and not video.audio_file_id:
+            await _upload_audio_to_dump_chat(bot, video, audio_path, file_paths[0], checkpoint)
         return video
 
 
+async def _upload_audio_to_dump_chat(
+    bot: Bot, video: YouTubeVideoData, audio_path: Path | None, video_path: Path, checkpoint: Checkpoint,
+) -> None:
+    """
+    Uploads the audio track the video was just merged from -- or, for a
+    progressive download, copied out of `video_path` -- so "🎵 Get audio" is
+    answered from the cache entry instead of a job downloading it again.
+    Best-effort: without it the button just falls back to that job.
+    """
+    try:
+        if audio_path is None:
+            audio_path = await run_blocking(extract_audio, video_path, video_path.parent)
+        if audio_path.stat().st_size > MAX_FILE_SIZE_BYTES:
+            log.info("audio of %s is too large to upload, leaving it to the audio job", video.cache_key)
+            return
+        video.audio_file_id = await upload_to_dump(
+            bot, "audio", audio_path, performer=video.author, title=video.title, duration=video.length,
+        )
+    except Exception as e:
+        log.warning("failed to upload the audio of %s, leaving it to the audio job: %r", video.cache_key, e)
+        return
+    checkpoint.video = video.model_dump_json()
+    await save_checkpoint(current_redis_client(), video.cache_key, checkpoint)
+    log.info("sent audio %s", audio_path)
+
+
 async def handle_social_video(bot: Bot, video: SocialVideoData) -> SocialVideoData:
+    redis_client = current_redis_client()
+    checkpoint = await load_checkpoint(redis_client, video.cache_key)
+    if checkpoint.complete:
+        log.info("%s was fully uploaded by an earlier attempt", video.cache_key)
+        resumed = SocialVideoData.model_validate_json(checkpoint.video)
+        resumed.file_ids = checkpoint.ordered_file_ids()
+        return resumed
+
     with tempfile.TemporaryDirectory() as tmp:
         tmp_path = Path(tmp)
         exc = None
 
         for i in range(3):
             try:
-                result = await asyncio.to_thread(download_social_video, video.link, tmp_path)
+                result = await run_blocking(download_social_video, video.link, tmp_path)
                 exc = None
                 break
             except SocialDownloadError:
@@ -118,7 +174,8 @@ async def handle_social_video(bot: Bot, video: SocialVideoData) -> SocialVideoDa
             file_paths = [result.file_path]
         else:
             n_parts = math.ceil(file_size / MAX_FILE_SIZE_BYTES)
-            file_paths = split_video(
+            file_paths = await run_blocking(
+                split_video,
                 duration_seconds=result.duration,
                 input_path=result.file_path,
                 output_dir=tmp_path,
@@ -128,15 +185,19 @@ async def handle_social_video(bot: Bot, video: SocialVideoData) -> SocialVideoDa
                 n_parts += 1
                 if n_parts > 10:
                     raise SocialDownloadError("Video too large, cannot split into <= 10 parts")
-                file_paths = split_video(
+                file_paths = await run_blocking(
+                    split_video,
                     duration_seconds=result.duration,
                     input_path=result.file_path,
                     output_dir=tmp_path,
                     n_parts=n_parts,
                 )
 
+        checkpoint.video = video.model_dump_json()
         log.info("sending %d part(s) to dump chat for %s", len(file_paths), video.link)
-        video.file_ids = await _upload_parts_to_dump_chat(bot, file_paths, video.width, video.height)
+        video.file_ids = await _upload_parts_to_dump_chat(
+            bot, file_paths, video.width, video.height, video.cache_key, checkpoint,
+        )
         return video
 
 
@@ -146,7 +207,12 @@ async def handle_audio_page(bot: Bot, tracks: list[AudioTrackData]) -> int:
     mutating each in place. Returns how many tracks failed and were skipped --
     one bad track (geo-blocked/removed) shouldn't take down the whole page.
     Up to 3 tracks are downloaded/uploaded concurrently.
+
+    Each track is written to its per-track cache as soon as it's uploaded, which
+    doubles as the page's checkpoint: a retry resolves those from the cache
+    and only works on what's left.
     """
+    redis_client = current_redis_client()
     semaphore = asyncio.Semaphore(3)
 
     async def process_one(track: AudioTrackData, tmp_path: Path) -> bool:
@@ -155,7 +221,7 @@ async def handle_audio_page(bot: Bot, tracks: list[AudioTrackData]) -> int:
             exc = None
             for i in range(3):
                 try:
-                    file_path = await asyncio.to_thread(download_track, track, tmp_path)
+                    file_path = await run_blocking(download_track, track, tmp_path)
                     exc = None
                     break
                 except AudioDownloadError as ex:
@@ -170,24 +236,10 @@ async def handle_audio_page(bot: Bot, tracks: list[AudioTrackData]) -> int:
                 log.error("giving up on track %s: %r", track.webpage_url, exc)
                 return False
 
-            media_message = None
-            for i in range(3):
-                try:
-                    media_message = await bot.send_audio(
-                        settings.dump_chat_id,
-                        types.FSInputFile(file_path),
-                        performer=track.uploader,
-                        title=track.title,
-                        duration=track.duration,
-                    )
-                    break
-                except TelegramNetworkError:
-                    if i == 2:
-                        raise
-                    log.warning('failed to send an audio track, retrying in 2 seconds')
-                    await asyncio.sleep(2)
-
-            track.file_id = media_message.audio.file_id
+            track.file_id = await upload_to_dump(
+                bot, "audio", file_path, performer=track.uploader, title=track.title, duration=track.duration,
+            )
+            await cache_set(redis_client, track.cache_key, encode(track))
             log.info("uploaded track %s -> %s", track.webpage_url, track.file_id)
             return True
 
@@ -0,0 +1,63 @@
+from typing import Any
+
+import dramatiq
+
+from bot.config import settings
+from bot.worker.broker import broker
+
+# One queue per job type, so a 45-minute YouTube encode can't sit in front of
+# a 10-second clip. Workers are allocated to queues with dramatiq's `--queues`
+# flag (see compose.yml); within a worker, actor `priority` decides which of the
+# already-fetched messages runs first (lower runs first).
+YOUTUBE_QUEUE = "youtube"
+YOUTUBE_LONG_QUEUE = "youtube_long"  # process_youtube_link moves long videos here, see youtube_queue_for
+SOCIAL_QUEUE = "social"
+AUDIO_QUEUE = "audio"
+DEFAULT_QUEUE = "default"  # report_actor_failure
+
+QUEUES = (YOUTUBE_QUEUE, YOUTUBE_LONG_QUEUE, SOCIAL_QUEUE, AUDIO_QUEUE, DEFAULT_QUEUE)
+
+# YOUTUBE_LONG_QUEUE has no actor of its own, so nothing would declare it -- and
+# workers only consume declared queues
+for _queue_name in QUEUES:
+    broker.declare_queue(_queue_name)
+
+
+class ActorStub:
+    """Enough of a dramatiq.Actor to enqueue it: .message() and .send()."""
+
+    def __init__(self, actor_name: str, queue_name: str) -> None:
+        self.actor_name = actor_name
+        self.queue_name = queue_name
+
+    def message(self, *args: Any) -> dramatiq.Message:
+        return dramatiq.Message(
+            queue_name=self.queue_name, actor_name=self.actor_name, args=args, kwargs={}, options={},
+        )
+
+    def send(self, *args: Any) -> dramatiq.Message:
+        return broker.enqueue(self.message(*args))
+
+
+def send_to_queue(actor: dramatiq.Actor | ActorStub, queue_name: str, *args: Any) -> dramatiq.Message:
+    """actor.send(*args), but onto `queue_name` instead of the actor's own queue.
+
+    Retries keep the message's queue, so a rerouted job also retries on it.
+    """
+    message = actor.message(*args)
+    return broker.enqueue(message.copy(queue_name=queue_name))
+
+
+def youtube_queue_for(length: int | None) -> str:
+    """Routes a YouTube job by its duration.
+
+    Duration is the best pre-download proxy for the job's cost: download size,
+    merge/encode time and the number of parts all grow with it. The bot
+    doesn't know it -- asking YouTube there would hold up every cache miss --
+    so jobs start on the regular queue and the worker moves them once it has
+    fetched the video (see bot.worker.actors). Unknown durations stay on the
+    regular queue -- a video YouTube won't describe usually fails fast.
+    """
+    if length is not None and length > settings.youtube_long_video_seconds:
+        return YOUTUBE_LONG_QUEUE
+    return YOUTUBE_QUEUE
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import threading
+from collections.abc import Awaitable, Callable
+from contextlib import suppress
+from contextvars import ContextVar
+from typing import Concatenate
+
+import dramatiq
+from aiogram import Bot
+from dramatiq.asyncio import get_event_loop_thread
+from dramatiq.middleware.asyncio import AsyncIO
+
+from bot.config import settings
+from bot.events.signals import drain_events
+from bot.util.redis import create_redis_client, use_redis_client
+from bot.util.telegram import create_bot
+from bot.util.youtube.whisper import whisper
+from bot.worker.broker import broker
+
+log = logging.getLogger(__name__)
+
+
+class WorkerRuntime:
+    """
+    Long-lived state for dramatiq actors: an event loop, plus the Bot (and so
+    its aiohttp session) and the pooled Redis client bound to it.
+
+    redis-py's async pool and aiohttp's session are both tied to the loop that
+    first used them, so the loop must outlive them: it runs for the runtime's
+    whole lifetime.
+
+    In the default threads mode every worker thread owns one runtime and drives
+    its loop itself. With `settings.worker_asyncio` there is a single runtime
+    per process, bound to the loop of dramatiq's AsyncIO event loop thread, and
+    all jobs run on it concurrently.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.loop = loop
+        self.bot = create_bot(settings.bot_token)
+        # extra tokens that only ever upload to the dump chats, see bot.worker.dump
+        self.uploaders = [create_bot(token) for token in settings.uploader_bot_tokens]
+        self.redis = create_redis_client()
+
+    async def bind[R](self, coro: Awaitable[R]) -> R:
+        _current.set(self)
+        use_redis_client(self.redis)
+        return await coro
+
+    def run_until_complete[R](self, coro: Awaitable[R]) -> R:
+        task = self.loop.create_task(self.bind(coro))
+        try:
+            return self.loop.run_until_complete(task)
+        except BaseException:
+            # dramatiq's TimeLimit/Shutdown interrupts are raised asynchronously
+            # into this thread, possibly while the loop is mid-iteration: cancel
+            # the job and let it unwind (release locks, etc.) before re-raising,
+            # so the loop is left clean for the thread's next message
+            if not task.done():
+                task.cancel()
+                with suppress(BaseException):
+                    self.loop.run_until_complete(task)
+            raise
+        finally:
+            # the job's signal handlers ran in the background; finish them and
+            # flush buffered stats before the loop idles until the next message
+            try:
+                self.loop.run_until_complete(self.bind(drain_events()))
+            except Exception:
+                log.exception("failed to drain the job's event handlers")
+
+    async def aclose(self) -> None:
+        for bot in (self.bot, *self.uploaders):
+            await bot.session.close()
+        await self.redis.aclose()
+
+
+_local = threading.local()
+_shared: WorkerRuntime | None = None
+_current: ContextVar[WorkerRuntime] = ContextVar("current_worker_runtime")
+
+
+def current_runtime() -> WorkerRuntime:
+    """The runtime the calling job runs on; only valid inside run_job."""
+    return _current.get()
+
+
+def _thread_runtime() -> WorkerRuntime:
+    runtime = getattr(_local, "runtime", None)
+    if runtime is None:
+        runtime = _local.runtime = WorkerRuntime(asyncio.new_event_loop())
+    return runtime
+
+
+def _close_thread_runtime() -> None:
+    runtime = getattr(_local, "runtime", None)
+    if runtime is None:
+        return
+    _local.runtime = None
+    try:
+        runtime.loop.run_until_complete(runtime.aclose())
+        runtime.loop.run_until_complete(runtime.loop.shutdown_asyncgens())
+    except Exception:
+        log.exception("failed to close worker runtime cleanly")
+    finally:
+        runtime.loop.close()
+
+
+def run_job[**P, R](fn: Callable[Concatenate[Bot, P], Awaitable[R]], *args: P.args, **kwargs: P.kwargs) -> R:
+    """Runs `fn(bot, *args, **kwargs)` to completion on the worker's runtime,
+    blocking the calling dramatiq worker thread until it's done."""
+    if not settings.worker_asyncio:
+        runtime = _thread_runtime()
+        return runtime.run_until_complete(fn(runtime.bot, *args, **kwargs))
+
+    event_loop_thread = get_event_loop_thread()
+    if _shared is None or event_loop_thread is None:
+        raise RuntimeError("asyncio worker runtime is not running")
+    # run_coroutine turns dramatiq's TimeLimit/Shutdown interrupts into a
+    # cancellation of just this job's task, leaving the shared loop alone
+    return event_loop_thread.run_coroutine(_shared.bind(fn(_shared.bot, *args, **kwargs)))
+
+
+class WorkerRuntimeMiddleware(dramatiq.Middleware):
+    """Builds the worker's runtime(s) up front (and warms the Whisper model) and tears them down on shutdown."""
+
+    def after_worker_boot(self, broker: dramatiq.Broker, worker: dramatiq.Worker) -> None:
+        global _shared
+        if settings.enable_audio_translation:
+            whisper.warm_up()
+        if settings.worker_asyncio:
+            event_loop_thread = get_event_loop_thread()
+            assert event_loop_thread is not None, "AsyncIO middleware must run before this one"
+            _shared = WorkerRuntime(event_loop_thread.loop)
+
+    def before_worker_shutdown(self, broker: dramatiq.Broker, worker: dramatiq.Worker) -> None:
+        global _shared
+        event_loop_thread = get_event_loop_thread()
+        if _shared is not None and event_loop_thread is not None:
+            try:
+                event_loop_thread.run_coroutine(_shared.bind(drain_events()))
+                event_loop_thread.run_coroutine(_shared.aclose())
+            except Exception:
+                log.exception("failed to close worker runtime cleanly")
+        _shared = None
+
+    def after_worker_thread_boot(self, broker: dramatiq.Broker, thread: object) -> None:
+        if not settings.worker_asyncio:
+            _thread_runtime()
+
+    def before_worker_thread_shutdown(self, broker: dramatiq.Broker, thread: object) -> None:
+        _close_thread_runtime()
+
+
+if settings.worker_asyncio:
+    broker.add_middleware(AsyncIO())
+broker.add_middleware(WorkerRuntimeMiddleware())
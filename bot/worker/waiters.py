@@ -1,6 +1,11 @@
+from typing import NamedTuple
+
 from pydantic import BaseModel
 from redis.asyncio import Redis
 
+from bot.util.cache import cache_ttl
+from bot.util.redis import redis_client as shared_redis_client
+
 
 class Waiter(BaseModel):
     chat_id: int
@@ -9,10 +14,59 @@ class Waiter(BaseModel):
     ack_message_id: int | None = None
 
 
+class Lookup(NamedTuple):
+    key: str | None  # the cache key that hit, None on a miss
+    value: str | None
+    is_first: bool  # on a miss: whether the caller should enqueue the processing job
+
+
 def _waiters_key(cache_key: str) -> str:
     return f"{cache_key}:waiters"
 
 
+# KEYS are the cache keys to look up, in order, followed by the waiters list.
+# Returns {i, value} for the first cache key that exists, refreshing its TTL
+# (ARGV[3 + i], 0 for none); otherwise registers the waiter (ARGV[1], chat id
+# in ARGV[2], list TTL in ARGV[3]) and returns {0, 1} if it's the first one.
+# A chat that is already waiting isn't added twice -- a re-sent link or a
+# re-tapped button must not lead to a double delivery -- and gets {0, 0}.
+_LOOKUP_OR_REGISTER_SCRIPT = """
+for i = 1, #KEYS - 1 do
+    local value = redis.call('GET', KEYS[i])
+    if value then
+        if tonumber(ARGV[3 + i]) > 0 then redis.call('EXPIRE', KEYS[i], ARGV[3 + i]) end
+        return {i, value}
+    end
+end
+local waiters = KEYS[#KEYS]
+for _, raw in ipairs(redis.call('LRANGE', waiters, 0, -1)) do
+    if cjson.decode(raw)['chat_id'] == tonumber(ARGV[2]) then return {0, 0} end
+end
+local length = redis.call('RPUSH', waiters, ARGV[1])
+redis.call('EXPIRE', waiters, ARGV[3])
+if length == 1 then return {0, 1} end
+return {0, 0}
+"""
+# EVALSHA through the caller's client, see bot.util.rate_limit
+_lookup_or_register_script = shared_redis_client.register_script(_LOOKUP_OR_REGISTER_SCRIPT)
+
+
+async def lookup_or_register_waiter(
+    redis_client: Redis, lookup_keys: list[str], cache_key: str, waiter: Waiter, ttl: int,
+) -> Lookup:
+    """
+    Returns the first of `lookup_keys` that is cached or, if none is, registers
+    a waiter for `cache_key` -- in a single atomic round-trip, so a job can't
+    finish between the miss and the registration and leave the waiter behind.
+    """
+    keys = [*lookup_keys, _waiters_key(cache_key)]
+    args = [waiter.model_dump_json(), str(waiter.chat_id), ttl, *(cache_ttl(k) or 0 for k in lookup_keys)]
+    index, value = await _lookup_or_register_script(keys=keys, args=args, client=redis_client)
+    if index:
+        return Lookup(lookup_keys[index - 1], value, False)
+    return Lookup(None, None, bool(value))
+
+
 async def register_waiter(redis_client: Redis, cache_key: str, waiter: Waiter, ttl: int) -> bool:
     """
     Registers a waiter for the given cache key. Returns True if this waiter
@@ -20,10 +74,8 @@ async def register_waiter(redis_client: Redis, cache_key: str, waiter: Waiter, t
     job in that case); False if a job for this cache key is already in
     flight (the caller should not enqueue a second one).
     """
-    key = _waiters_key(cache_key)
-    length = await redis_client.rpush(key, waiter.model_dump_json())
-    await redis_client.expire(key, ttl)
-    return length == 1
+    lookup = await lookup_or_register_waiter(redis_client, [], cache_key, waiter, ttl)
+    return lookup.is_first
 
 
 async def pop_waiters(redis_client: Redis, cache_key: str) -> list[Waiter]:
@@ -34,3 +86,12 @@ async def pop_waiters(redis_client: Redis, cache_key: str) -> list[Waiter]:
         pipe.delete(key)
         raw_entries, _ = await pipe.execute()
     return [Waiter.model_validate_json(raw) for raw in raw_entries]
+
+
+async def peek_waiters(redis_client: Redis, cache_keys: list[str]) -> list[list[Waiter]]:
+    """The waiters registered for each of `cache_keys`, left in place; one round-trip."""
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for cache_key in cache_keys:
+            pipe.lrange(_waiters_key(cache_key), 0, -1)
+        results = await pipe.execute()
+    return [[Waiter.model_validate_json(raw) for raw in raw_entries] for raw_entries in results]
@@ -1,20 +1,21 @@
 import asyncio
 import logging
 
-from aiogram import Bot
 from aiogram.client.default import DefaultBotProperties
 from dotenv import load_dotenv
 
 from bot.config import settings
 from bot.dispatcher import dp, router
-from bot.events import freeze_signals
+from bot.events.signals import drain_events, freeze_signals
+from bot.util.redis import redis_client
+from bot.util.telegram import create_bot
 from bot.util.telegram_log_handler import install_admin_alert_handler
 
 
 async def main():
     from bot import handlers  # noqa
 
-    the_bot = Bot(settings.bot_token, default=DefaultBotProperties(parse_mode="HTML"))
+    the_bot = create_bot(settings.bot_token, default=DefaultBotProperties(parse_mode="HTML"))
     dp.include_router(router)
     me = await the_bot.get_me()
 
@@ -23,7 +24,13 @@ async def main():
 
     # freeze signals before starting the polling (non-frozen signals unable to send signals)
     freeze_signals()
-    await dp.start_polling(the_bot)
+    try:
+        await dp.start_polling(the_bot)
+    finally:
+        # signal handlers still running and buffered stats; the shutdown hooks
+        # have closed the Redis pool by now, it reconnects for this last write
+        await drain_events()
+        await redis_client.aclose()
 
 
 def setup():